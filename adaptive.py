@@ -0,0 +1,96 @@
+import threading
+import time
+
+from retry import is_throttling_error
+
+
+class AIMDController:
+    """
+    Adapts the number of workers of a pipeline stage with additive increase and
+    multiplicative decrease, like TCP congestion control.
+
+    Jobs are observed in rounds of as many jobs as there are workers. After a
+    round without throttling, one worker is added if the throughput held up,
+    or removed if the latency more than doubled compared to the best round.
+    Any throttling halves the workers right away, at most once a round.
+    """
+
+    def __init__(self, set_workers, workers, minimum=1, maximum=32):
+        """
+        Args:
+            set_workers (function): Called with the new number of workers.
+            workers (int): The initial number of workers.
+            minimum (int, optional): The lowest number of workers.
+            maximum (int, optional): The highest number of workers.
+        """
+        self.set_workers = set_workers
+        self.workers = workers
+        self.minimum = minimum
+        self.maximum = maximum
+        self._lock = threading.Lock()
+        self._best_latency = None
+        self._last_throughput = None
+        self._start_round()
+
+    def _start_round(self):
+        self._round_start = time.monotonic()
+        self._round_jobs = 0
+        self._round_latency = 0.0
+        self._round_throttled = False
+
+    def set_maximum(self, maximum):
+        """Change the highest number of workers, e.g. from the settings."""
+        with self._lock:
+            self.maximum = maximum
+            if self.workers > maximum:
+                self._apply(maximum)
+
+    def _apply(self, workers):
+        workers = max(self.minimum, min(self.maximum, workers))
+        if workers != self.workers:
+            self.workers = workers
+            self.set_workers(workers)
+
+    def record_throttled(self):
+        """Observe throttling, e.g. a retried request that was rate limited."""
+        with self._lock:
+            self._throttle()
+
+    def _throttle(self):
+        if not self._round_throttled:
+            self._round_throttled = True
+            self._apply(self.workers // 2)
+
+    def record(self, latency, error=None):
+        """
+        Observe a finished job.
+
+        Args:
+            latency (float): How long the job took, in seconds.
+            error (Exception, optional): The error the job failed with.
+        """
+        with self._lock:
+            if error is not None and is_throttling_error(error):
+                self._throttle()
+                return
+
+            self._round_jobs += 1
+            self._round_latency += latency
+            if self._round_jobs < self.workers:
+                return
+
+            elapsed = max(time.monotonic() - self._round_start, 1e-6)
+            throughput = self._round_jobs / elapsed
+            latency = self._round_latency / self._round_jobs
+            if not self._round_throttled:
+                if self._best_latency and latency > 2 * self._best_latency:
+                    self._apply(self.workers - 1)
+                elif (
+                    self._last_throughput is None
+                    or throughput >= 0.9 * self._last_throughput
+                ):
+                    self._apply(self.workers + 1)
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+            self._last_throughput = throughput
+            self._start_round()
@@ -0,0 +1,176 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from http_session import get_session
+from metrics import get_metrics
+
+
+class AlbumArtCache:
+    """
+    Content-addressed cache for album covers.
+
+    Covers are stored once per distinct content (by SHA-256) in an in-memory
+    LRU with a byte budget, backed by a folder on disk. The mapping from image
+    URL to content digest is kept in the metadata cache, so a cover is only
+    downloaded once per album, across runs.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        metadata_cache=None,
+        memory_budget=32 * 1024 * 1024,
+        max_size=0,
+        jpeg_quality=90,
+    ):
+        """
+        Args:
+            cache_dir (str): The folder covers are stored in.
+            metadata_cache (MetadataCache, optional): Where the URL to digest
+                mapping is persisted. Without it, the mapping only lives in memory.
+            memory_budget (int, optional): Bytes of covers kept in memory.
+            max_size (int, optional): Covers larger than this many pixels on any
+                side are downscaled and recompressed. Zero keeps them unchanged.
+            jpeg_quality (int, optional): JPEG quality used when recompressing.
+        """
+        self.cache_dir = cache_dir
+        self.metadata_cache = metadata_cache
+        self.memory_budget = memory_budget
+        self.max_size = max_size
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._digests: dict[str, str] = {}
+        # A lock per URL being fetched, with the number of threads using it
+        self._url_locks: dict[str, tuple[threading.Lock, int]] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, url):
+        """
+        Return the cover at `url`, downloading it only if it is not cached.
+
+        Returns:
+            bytes: The JPEG data of the cover.
+
+        Raises:
+            requests.RequestException: If the cover could not be downloaded.
+            OSError: If the response is not an image. Nothing is cached then.
+        """
+        # The processed cover depends on the size setting, so it is part of the key
+        key = f"{self.max_size}:{url}"
+        with self._lock:
+            url_lock, users = self._url_locks.get(key, (threading.Lock(), 0))
+            self._url_locks[key] = (url_lock, users + 1)
+
+        # Tracks of the same album ask for the same cover at the same time;
+        # only the first one downloads it
+        try:
+            with url_lock:
+                return self._get(key, url)
+        finally:
+            with self._lock:
+                url_lock, users = self._url_locks[key]
+                if users == 1:
+                    del self._url_locks[key]
+                else:
+                    self._url_locks[key] = (url_lock, users - 1)
+
+    def _get(self, key, url):
+        digest = self._get_digest(key)
+        if digest:
+            data = self._load(digest)
+            if data is not None:
+                get_metrics().increment("art_cache_total", result="hit")
+                return data
+
+        get_metrics().increment("art_cache_total", result="miss")
+        with get_metrics().time("art_fetch_seconds"):
+            response = get_session().get(url, timeout=30)
+        response.raise_for_status()
+        data = self._process(response.content)
+        digest = hashlib.sha256(data).hexdigest()
+        self._store(digest, data)
+        self._set_digest(key, digest)
+        return data
+
+    def _get_digest(self, key):
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None and self.metadata_cache:
+            digest = self.metadata_cache.get("cover", key)
+        return digest
+
+    def _set_digest(self, key, digest):
+        with self._lock:
+            self._digests[key] = digest
+        if self.metadata_cache:
+            # The digest is checked against the stored cover, not its age
+            self.metadata_cache.put("cover", key, digest, expires=False)
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def _load(self, digest):
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                return data
+
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        self._remember(digest, data)
+        return data
+
+    def _store(self, digest, data):
+        path = self._path(digest)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        self._remember(digest, data)
+
+    def _remember(self, digest, data):
+        """Keep a cover in memory, evicting the least recently used ones."""
+        if len(data) > self.memory_budget:
+            return
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return
+            self._memory[digest] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_budget:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _process(self, data):
+        """
+        Check that a cover decodes, then downscale and recompress it if it
+        exceeds the configured size.
+
+        Raises:
+            OSError: If the data is not an image, e.g. an error page.
+        """
+        from PIL import Image
+
+        # Anything stored is used as the cover from then on, so it is decoded
+        # in full, not only identified by its header
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        if not self.max_size or max(image.size) <= self.max_size:
+            return data
+        image.thumbnail((self.max_size, self.max_size))
+        output = io.BytesIO()
+        image.convert("RGB").save(
+            output, format="JPEG", quality=self.jpeg_quality, optimize=True
+        )
+        return output.getvalue()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all download workers to cap their total throughput.
+
+    Consumers take the bytes they just received and sleep off any deficit, so
+    the bucket can go into debt and the sleeping is spread over the workers
+    proportionally to what they download.
+    """
+
+    def __init__(self, rate=0):
+        """
+        Args:
+            rate (float, optional): The allowed bytes per second. Zero means
+                unlimited.
+        """
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = rate
+        self._last_refill = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """Change the allowed bytes per second, also while downloads are running."""
+        with self._lock:
+            self._refill()
+            self._rate = rate
+            self._tokens = min(self._tokens, rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        # At most one second worth of bytes is saved up, to limit bursts
+        self._tokens = min(
+            self._rate, self._tokens + (now - self._last_refill) * self._rate
+        )
+        self._last_refill = now
+
+    def consume(self, amount):
+        """Take `amount` bytes from the bucket, sleeping while it is in debt."""
+        with self._lock:
+            if not self._rate:
+                return
+            self._refill()
+            self._tokens -= amount
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class BandwidthLimiter:
+    """
+    Applies a shared TokenBucket to yt-dlp downloads through a progress hook.
+
+    yt-dlp calls the hook every time a download or fragment receives data;
+    sleeping in the hook pauses that download, which throttles it.
+    """
+
+    def __init__(self, rate=0):
+        self.bucket = TokenBucket(rate)
+        self._lock = threading.Lock()
+        self._received: dict[str, int] = {}
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+
+    def progress_hook(self, status):
+        key = status.get("tmpfilename") or status.get("filename")
+        if status["status"] != "downloading":
+            with self._lock:
+                self._received.pop(key, None)
+            return
+
+        downloaded = status.get("downloaded_bytes") or 0
+        with self._lock:
+            received = downloaded - self._received.get(key, 0)
+            self._received[key] = downloaded
+        if received > 0:
+            self.bucket.consume(received)
@@ -0,0 +1 @@
+"""Benchmarks for the download pipeline, run with `python -m benchmarks.<name>`."""
@@ -0,0 +1,293 @@
+"""
+Local stand-ins for the Spotify Web API and YouTube, for offline benchmarks.
+
+One HTTP server answers both:
+
+- the Spotify endpoints the downloader uses: the client credentials token,
+  playlists and their paginated items, single and several tracks, search,
+  and the album covers the track objects point to
+- a media source: /search returns flat yt-dlp search results for a query,
+  whose URLs point at /media, which serves a generated audio file that
+  yt-dlp downloads like any direct media link
+
+Playlists are generated on first use. The playlist "bench<N>" has N tracks,
+spread over albums of ALBUM_SIZE tracks so covers are shared like in a real
+playlist. Every response waits `latency` seconds first, and media and covers
+are sent at no more than `bandwidth` bytes per second per connection.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+ALBUM_SIZE = 12
+PAGE_SIZE = 100
+SEND_CHUNK_SIZE = 16 * 1024
+
+
+def make_playlist_tracks(playlist_id, size, base_url, track_seconds):
+    """Return the Spotify track objects of a generated playlist."""
+    tracks = []
+    for index in range(size):
+        album_index = index // ALBUM_SIZE
+        artist = {"name": f"Artist {playlist_id} {album_index}"}
+        tracks.append(
+            {
+                "id": f"{playlist_id}t{index:05d}",
+                "name": f"Song {index}",
+                "artists": [artist],
+                "duration_ms": track_seconds * 1000,
+                "track_number": index % ALBUM_SIZE + 1,
+                "disc_number": 1,
+                "external_ids": {"isrc": f"BENCH{index:07d}"},
+                "album": {
+                    "name": f"Album {album_index}",
+                    "artists": [artist],
+                    "total_tracks": ALBUM_SIZE,
+                    "release_date": "2020-01-01",
+                    "images": [
+                        {"url": f"{base_url}/images/{playlist_id}a{album_index}.jpg"}
+                    ],
+                },
+            }
+        )
+    return tracks
+
+
+class FakeServices:
+    """Serves the fake Spotify API and media source from a background thread."""
+
+    def __init__(
+        self,
+        audio_path,
+        cover_path,
+        track_seconds,
+        latency=0.0,
+        bandwidth=0,
+        host="127.0.0.1",
+        port=0,
+    ):
+        """
+        Args:
+            audio_path (str): The audio file served for every track.
+            cover_path (str): The JPEG served for every album cover.
+            track_seconds (int): The duration of the audio file, reported as
+                the duration of every track and search result.
+            latency (float, optional): Seconds to wait before every response.
+            bandwidth (int, optional): Bytes per second per connection for
+                media and covers, zero for unlimited.
+        """
+        with open(audio_path, "rb") as f:
+            self.audio = f.read()
+        with open(cover_path, "rb") as f:
+            self.cover = f.read()
+        self.track_seconds = track_seconds
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.playlists: dict[str, list[dict]] = {}
+        self.tracks: dict[str, dict] = {}
+        # Tracks by the media search queries the downloader makes for them
+        self.queries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                services._handle(handler)
+
+            def do_HEAD(handler):
+                services._handle(handler)
+
+            def do_POST(handler):
+                services._handle(handler)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="fake-services", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_playlist(self, playlist_id):
+        match = re.fullmatch(r"bench(\d+)", playlist_id)
+        if not match:
+            return None
+        with self._lock:
+            if playlist_id not in self.playlists:
+                tracks = make_playlist_tracks(
+                    playlist_id, int(match.group(1)), self.url, self.track_seconds
+                )
+                self.playlists[playlist_id] = tracks
+                for track in tracks:
+                    self.tracks[track["id"]] = track
+                    name_query = f"{track['name']} {track['artists'][0]['name']}"
+                    self.queries[name_query] = track
+                    self.queries[f'"{track["external_ids"]["isrc"]}"'] = track
+            return self.playlists[playlist_id]
+
+    def _handle(self, handler):
+        time.sleep(self.latency)
+        url = urlparse(handler.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+
+        if path == "/api/token":
+            return self._send_json(
+                handler,
+                {"access_token": "bench", "token_type": "Bearer", "expires_in": 3600},
+            )
+        if match := re.fullmatch(r"/v1/playlists/(\w+)", path):
+            tracks = self.get_playlist(match.group(1))
+            if tracks is None:
+                return handler.send_error(404)
+            return self._send_json(
+                handler,
+                {
+                    "id": match.group(1),
+                    "name": match.group(1),
+                    "snapshot_id": f"{len(tracks)}",
+                },
+            )
+        # Newer spotipy versions use the /items endpoint
+        if match := re.fullmatch(r"/v1/playlists/(\w+)/(?:tracks|items)", path):
+            return self._send_playlist_page(handler, match.group(1), params)
+        if match := re.fullmatch(r"/v1/tracks/(\w+)", path):
+            track = self.tracks.get(match.group(1))
+            if track is None:
+                return handler.send_error(404)
+            return self._send_json(handler, track)
+        if path == "/v1/tracks":
+            ids = params.get("ids", "").split(",")
+            return self._send_json(
+                handler, {"tracks": [self.tracks.get(track_id) for track_id in ids]}
+            )
+        if path == "/v1/search":
+            return self._send_json(handler, {"tracks": {"items": [], "total": 0}})
+        if path.startswith("/images/"):
+            return self._send_bytes(handler, self.cover, "image/jpeg")
+        if path == "/search":
+            return self._send_search_results(handler, params)
+        if path.startswith("/media/"):
+            return self._send_bytes(handler, self.audio, "audio/webm")
+        handler.send_error(404)
+
+    def _send_playlist_page(self, handler, playlist_id, params):
+        tracks = self.get_playlist(playlist_id)
+        if tracks is None:
+            return handler.send_error(404)
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", PAGE_SIZE)), PAGE_SIZE)
+        next_url = None
+        if offset + limit < len(tracks):
+            next_url = (
+                f"{self.url}/v1/playlists/{playlist_id}/items"
+                f"?offset={offset + limit}&limit={limit}"
+            )
+        self._send_json(
+            handler,
+            {
+                "items": [
+                    {"track": track} for track in tracks[offset : offset + limit]
+                ],
+                "offset": offset,
+                "limit": limit,
+                "total": len(tracks),
+                "next": next_url,
+            },
+        )
+
+    def _send_search_results(self, handler, params):
+        track = self.queries.get(params.get("q", ""))
+        entries = []
+        if track:
+            artist = track["artists"][0]["name"]
+            entries.append(
+                {
+                    "id": track["id"],
+                    "url": f"{self.url}/media/{track['id']}.webm",
+                    "title": f"{artist} - {track['name']}",
+                    "channel": artist,
+                    "duration": self.track_seconds,
+                }
+            )
+        self._send_json(handler, {"entries": entries[: int(params.get("limit", 1))]})
+
+    def _send_json(self, handler, data):
+        body = json.dumps(data).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _send_bytes(self, handler, data, content_type):
+        """Send data, honouring a single byte range and the bandwidth limit."""
+        start, end = 0, len(data) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", handler.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), end)
+            if start > end:
+                handler.send_response(416)
+                handler.send_header("Content-Range", f"bytes */{len(data)}")
+                handler.end_headers()
+                return
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(end - start + 1))
+        handler.send_header("Accept-Ranges", "bytes")
+        handler.end_headers()
+        if handler.command == "HEAD":
+            return
+        try:
+            for offset in range(start, end + 1, SEND_CHUNK_SIZE):
+                chunk = data[offset : min(offset + SEND_CHUNK_SIZE, end + 1)]
+                handler.wfile.write(chunk)
+                if self.bandwidth:
+                    time.sleep(len(chunk) / self.bandwidth)
+        except ConnectionError:
+            # The client gave up, e.g. after it had what it needed
+            pass
+
+
+def generate_media(ffmpeg, directory, track_seconds):
+    """
+    Generate the audio file and cover the fake services serve.
+
+    Returns:
+        tuple[str, str]: The paths of the Opus audio in WebM and the JPEG cover.
+    """
+    audio_path = os.path.join(directory, f"tone-{track_seconds}s.webm")
+    cover_path = os.path.join(directory, "cover.jpg")
+    if not os.path.exists(audio_path):
+        subprocess.run(
+            [ffmpeg, "-y", "-v", "error", "-f", "lavfi"]
+            + ["-i", f"sine=frequency=440:duration={track_seconds}"]
+            + ["-c:a", "libopus", "-b:a", "128k", audio_path],
+            check=True,
+        )
+    if not os.path.exists(cover_path):
+        subprocess.run(
+            [ffmpeg, "-y", "-v", "error", "-f", "lavfi"]
+            + ["-i", "testsrc=size=640x640", "-frames:v", "1", cover_path],
+            check=True,
+        )
+    return audio_path, cover_path
@@ -0,0 +1,111 @@
+"""
+Measure the time to interactive of the GUI and fail when it is over budget.
+
+Each measurement runs in a fresh interpreter, from launching the process to
+the point where the window has been drawn and handles input, so it includes
+the interpreter start and every import. The heavy modules the downloader
+needs (yt-dlp, spotipy, requests, mutagen, Pillow) must not be imported by
+then; they load in the background or on first use.
+
+Without a display only the import of the GUI module is measured.
+
+Usage:
+    python -m benchmarks.startup [--budget SECONDS] [--runs N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Modules that must stay out of the startup path
+HEAVY_MODULES = ("yt_dlp", "spotipy", "requests", "mutagen", "PIL")
+
+IMPORT_SCRIPT = """
+import json, sys
+import gui
+print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in {heavy})))
+"""
+
+WINDOW_SCRIPT = """
+import json, sys
+import tkinter as tk
+from gui import MusicDownloaderGUI
+root = tk.Tk()
+app = MusicDownloaderGUI(root)
+root.update()
+print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in {heavy})))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def measure(script):
+    """
+    Run a script in a fresh interpreter and time it until it reports back.
+
+    Returns:
+        tuple[float, list[str]]: The seconds until the script printed the heavy
+            modules it had imported, and those modules.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import os\n" + script.format(heavy=HEAVY_MODULES)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.wait()
+    if process.returncode != 0 or not line:
+        raise RuntimeError("The startup script failed")
+    return elapsed, json.loads(line)
+
+
+def has_display():
+    if os.name == "nt" or sys.platform == "darwin":
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=1.0,
+        help="the highest accepted time to interactive, in seconds",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    script, label = IMPORT_SCRIPT, "Import of gui"
+    if has_display():
+        script, label = WINDOW_SCRIPT, "Time to interactive"
+    else:
+        print("No display, only measuring the import of the GUI module")
+
+    # The first run warms the file system cache and writes the background cache
+    measure(script)
+    timings = []
+    for _ in range(args.runs):
+        elapsed, heavy = measure(script)
+        timings.append(elapsed)
+    best = min(timings)
+    print(f"{label}: {best * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)}")
+        failed = True
+    if best > args.budget:
+        print("FAIL: over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
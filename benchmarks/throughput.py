@@ -0,0 +1,341 @@
+"""
+Measure the throughput of the download pipeline offline.
+
+The Spotify Web API and YouTube are replaced by local stand-ins (see
+benchmarks.fake_services) with configurable latency and bandwidth, so runs
+are repeatable and compare changes to the Downloader, not to the network.
+Every combination of playlist size and worker count runs in a fresh
+interpreter with an empty cache, journal and library, and reports:
+
+- tracks per minute, from starting the playlist to the last track
+- time to first track, from starting the playlist to the first tagged file
+- the peak RSS of the downloader process
+- the CPU seconds of the process and its FFmpeg children, and the average
+  CPU use as a percentage of one core
+
+Results are saved as JSON, and `--compare` prints them next to an earlier
+run. FFmpeg must be installed or downloaded; it generates the served audio.
+
+Usage:
+    python -m benchmarks.throughput [--sizes 10,1000,10000] [--workers 4,10]
+        [--latency SECONDS] [--bandwidth BYTES_PER_SECOND]
+        [--track-seconds N] [--format mp3] [--compare RESULTS.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_services import FakeServices, generate_media
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPOSITORY, "benchmarks", "results")
+
+
+def get_resource_usage():
+    """
+    Return the peak RSS in bytes of this process, None where the platform
+    does not report it, and the CPU seconds of this process and its finished
+    children. The peak RSS of the FFmpeg children is not reported, Linux
+    counts the memory of the parent they were forked from in it.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        times = os.times()
+        return {
+            "peak_rss": None,
+            "cpu_seconds": times.user + times.system,
+        }
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss": own.ru_maxrss * scale,
+        "cpu_seconds": own.ru_utime
+        + own.ru_stime
+        + children.ru_utime
+        + children.ru_stime,
+    }
+
+
+def run_download(services_url, playlist_id):
+    """
+    Download a playlist from the fake services in the current directory.
+
+    Runs in the child interpreter, whose working directory holds the settings
+    of the run.
+
+    Returns:
+        dict: The measurements of the run.
+    """
+    # Imported here so the parent process stays small
+    from downloader import Downloader
+    from http_session import get_session
+
+    class OfflineDownloader(Downloader):
+        """Searches the fake media source instead of YouTube."""
+
+        def search_videos(self, query, limit):
+            with self.metrics.time("youtube_search_seconds"):
+                response = self.youtube_source.call(
+                    get_session().get,
+                    f"{services_url}/search",
+                    params={"q": query, "limit": limit},
+                    timeout=30,
+                )
+            response.raise_for_status()
+            return response.json()["entries"]
+
+    start_cpu = get_resource_usage()["cpu_seconds"]
+    downloader = OfflineDownloader("songs")
+    client = downloader.spotify_client.client
+    client.prefix = f"{services_url}/v1/"
+    client.client_credentials_manager.OAUTH_TOKEN_URL = f"{services_url}/api/token"
+
+    lock = threading.Lock()
+    finished = threading.Event()
+    results = {"completed": 0, "failed": 0, "first_track": None}
+
+    def on_track_done(job):
+        with lock:
+            if job.error:
+                results["failed"] += 1
+            else:
+                results["completed"] += 1
+                if results["first_track"] is None:
+                    results["first_track"] = time.perf_counter() - start
+
+    def create_progress_bar(title, progress=None):
+        return (lambda current, total: None), (lambda: None)
+
+    downloader.track_done_listeners.append(on_track_done)
+    start = time.perf_counter()
+    downloader.download_playlist(
+        f"https://open.spotify.com/playlist/{playlist_id}",
+        create_progress_bar,
+        lambda current, total: None,
+        finished.set,
+    )
+    finished.wait()
+    elapsed = time.perf_counter() - start
+    downloader.shutdown_executor()
+
+    usage = get_resource_usage()
+    cpu_seconds = usage["cpu_seconds"] - start_cpu
+    return {
+        "completed": results["completed"],
+        "failed": results["failed"],
+        "seconds": elapsed,
+        "tracks_per_minute": results["completed"] / elapsed * 60,
+        "time_to_first_track": results["first_track"],
+        "peak_rss": usage["peak_rss"],
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent": cpu_seconds / elapsed * 100,
+    }
+
+
+def run_child(args):
+    """Entry point of the child interpreter: one run, reported as JSON."""
+    result = run_download(args.services_url, args.playlist)
+    print(json.dumps(result))
+
+
+def measure(services, ffmpeg_dir, size, workers, output_format, timeout):
+    """Run one download of a `size` track playlist in a fresh interpreter."""
+    with tempfile.TemporaryDirectory(prefix="music-downloader-bench-") as directory:
+        with open(os.path.join(directory, "settings.json"), "w") as f:
+            json.dump(
+                {
+                    "download_path": "songs",
+                    "max_thread_workers": workers,
+                    "output_format": output_format,
+                },
+                f,
+            )
+        with open(os.path.join(directory, ".env"), "w") as f:
+            f.write("CLIENT_ID=bench\nCLIENT_SECRET=bench\n")
+
+        # The run has its own working directory, so a bundled FFmpeg is only
+        # found through the PATH
+        env = dict(
+            os.environ,
+            PYTHONPATH=REPOSITORY,
+            PATH=ffmpeg_dir + os.pathsep + os.environ.get("PATH", ""),
+        )
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.throughput", "--child"]
+            + ["--services-url", services.url, "--playlist", f"bench{size}"],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"The run of {size} tracks with {workers} workers failed:\n"
+                + process.stderr[-2000:]
+            )
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPOSITORY,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def format_megabytes(size):
+    return f"{size / (1024 * 1024):.0f} MB" if size is not None else "-"
+
+
+def print_results(runs, previous=None):
+    """Print a table of runs, with the change against an earlier run if given."""
+    previous_runs = {
+        (run["size"], run["workers"]): run for run in (previous or {}).get("runs", [])
+    }
+    print(
+        f"{'tracks':>7} {'workers':>7} {'tracks/min':>14} {'first track':>13}"
+        f" {'peak RSS':>9} {'CPU':>8} {'CPU use':>8}"
+    )
+    for run in runs:
+        rate = f"{run['tracks_per_minute']:.1f}"
+        earlier = previous_runs.get((run["size"], run["workers"]))
+        if earlier and earlier["tracks_per_minute"]:
+            change = run["tracks_per_minute"] / earlier["tracks_per_minute"] - 1
+            rate += f" ({change:+.0%})"
+        first = run["time_to_first_track"]
+        print(
+            f"{run['size']:>7} {run['workers']:>7} {rate:>14}"
+            f" {f'{first:.2f}s' if first is not None else '-':>13}"
+            f" {format_megabytes(run['peak_rss']):>9}"
+            f" {run['cpu_seconds']:>7.1f}s {run['cpu_percent']:>7.0f}%"
+        )
+        if run["failed"]:
+            print(f"        {run['failed']} tracks failed")
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=parse_list, default=[10, 1000, 10000])
+    parser.add_argument("--workers", type=parse_list, default=[4, 10])
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds the fake services wait before every response",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=int,
+        default=2 * 1024 * 1024,
+        help="bytes per second of every media download, 0 for unlimited",
+    )
+    parser.add_argument(
+        "--track-seconds",
+        type=int,
+        default=30,
+        help="the duration of the generated audio of every track",
+    )
+    parser.add_argument("--format", default="mp3", help="the output audio format")
+    parser.add_argument(
+        "--timeout", type=float, default=6 * 3600, help="seconds allowed per run"
+    )
+    parser.add_argument("--output", help="the file to save the results to")
+    parser.add_argument("--compare", help="results of an earlier run to compare to")
+    # Used when the benchmark starts itself for a single run
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--services-url", help=argparse.SUPPRESS)
+    parser.add_argument("--playlist", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from ffmpeg_utils import get_ffmpeg_executable
+
+    ffmpeg = get_ffmpeg_executable()
+    if ffmpeg is None:
+        sys.exit("FFmpeg not found, run the app once to download it")
+    ffmpeg = os.path.abspath(ffmpeg)
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+
+    media_dir = os.path.join(tempfile.gettempdir(), "music-downloader-bench-media")
+    os.makedirs(media_dir, exist_ok=True)
+    audio_path, cover_path = generate_media(ffmpeg, media_dir, args.track_seconds)
+    services = FakeServices(
+        audio_path,
+        cover_path,
+        args.track_seconds,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+    )
+
+    runs = []
+    try:
+        for size in args.sizes:
+            for workers in args.workers:
+                print(f"Downloading {size} tracks with {workers} workers...")
+                result = measure(
+                    services,
+                    os.path.dirname(ffmpeg),
+                    size,
+                    workers,
+                    args.format,
+                    args.timeout,
+                )
+                runs.append({"size": size, "workers": workers, **result})
+    finally:
+        services.close()
+
+    print_results(runs, previous)
+    results = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+            "track_seconds": args.track_seconds,
+            "format": args.format,
+        },
+        "runs": runs,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"throughput-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import json
+import sqlite3
+import threading
+import time
+
+from spotipy.cache_handler import CacheHandler
+
+
+class MetadataCache:
+    """
+    On-disk cache for Spotify API responses, stored in a single SQLite file.
+
+    Entries are grouped by kind (e.g. "track", "album", "playlist") and keyed
+    by their Spotify ID. The cache is shared between worker threads.
+
+    Entries stored with `expires=False` are validated by other means than
+    their age, e.g. a playlist listing by its snapshot ID; only the size limit
+    evicts them.
+    """
+
+    # Number of writes between two pruning passes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, max_entries=20000, ttl_seconds=7 * 24 * 60 * 60):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            max_entries (int, optional): The maximum number of cached responses.
+                Zero disables the limit.
+            ttl_seconds (int, optional): How long a response stays valid.
+                Zero disables expiry.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " expires INTEGER NOT NULL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            self._connection.commit()
+
+    def _is_expired(self, updated_at):
+        return self.ttl_seconds and time.time() - updated_at > self.ttl_seconds
+
+    def get(self, kind, key):
+        """
+        Return a cached response, or None if it is missing or expired.
+
+        Args:
+            kind (str): The kind of the response.
+            key (str): The key of the response.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, updated_at, expires FROM entries"
+                " WHERE kind = ? AND key = ?",
+                (kind, key),
+            ).fetchone()
+        if row is None or (row[2] and self._is_expired(row[1])):
+            return None
+        return json.loads(row[0])
+
+    def get_many(self, kind, keys):
+        """
+        Return the cached responses for several keys.
+
+        Returns:
+            dict: The valid cached responses by key. Missing keys are omitted.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value, updated_at, expires FROM entries"
+                f" WHERE kind = ? AND key IN ({placeholders})",
+                (kind, *keys),
+            ).fetchall()
+        return {
+            key: json.loads(value)
+            for key, value, updated_at, expires in rows
+            if not (expires and self._is_expired(updated_at))
+        }
+
+    def put(self, kind, key, value, expires=True):
+        self.put_many(kind, {key: value}, expires)
+
+    def put_many(self, kind, values, expires=True):
+        """
+        Store several responses of the same kind.
+
+        Args:
+            kind (str): The kind of the responses.
+            values (dict): The responses by key.
+            expires (bool, optional): Whether the TTL applies to the responses.
+                Responses validated by other means (e.g. a snapshot ID) skip it.
+        """
+        now = time.time()
+        rows = [
+            (kind, key, json.dumps(value), now, expires)
+            for key, value in values.items()
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries"
+                " (kind, key, value, updated_at, expires) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._writes_since_prune += len(rows)
+            if self._writes_since_prune >= self.PRUNE_INTERVAL:
+                self._prune()
+            self._connection.commit()
+
+    def delete(self, kind, key):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            )
+            self._connection.commit()
+
+    def _prune(self):
+        """Drop expired entries and the oldest ones above the size limit."""
+        self._writes_since_prune = 0
+        if self.ttl_seconds:
+            self._connection.execute(
+                "DELETE FROM entries WHERE expires AND updated_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+        if self.max_entries:
+            self._connection.execute(
+                "DELETE FROM entries WHERE rowid IN ("
+                " SELECT rowid FROM entries ORDER BY updated_at DESC"
+                " LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SpotifyTokenCache(CacheHandler):
+    """
+    Spotipy cache handler that keeps the client-credentials token in the
+    metadata cache, so a restart does not always need a new token exchange.
+    """
+
+    def __init__(self, cache, client_id):
+        self.cache = cache
+        self.client_id = client_id
+
+    def get_cached_token(self):
+        return self.cache.get("token", self.client_id)
+
+    def save_token_to_cache(self, token_info):
+        # Spotipy checks the token expiry itself
+        self.cache.put("token", self.client_id, token_info, expires=False)
+
+
+class ResolutionCache:
+    """
+    Persistent mapping from Spotify track IDs to the YouTube videos they were
+    resolved to, so a track is only searched for once.
+
+    Entries never expire; a mapping is dropped when its video stops working.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions ("
+                " track_id TEXT PRIMARY KEY,"
+                " video_url TEXT NOT NULL,"
+                " match TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get(self, track_id):
+        """
+        Return the video a track was resolved to.
+
+        Returns:
+            dict | None: The `video_url` and the `match` metadata (title,
+                channel, duration, ...), or None if the track is unknown.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT video_url, match FROM resolutions WHERE track_id = ?",
+                (track_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"video_url": row[0], "match": json.loads(row[1])}
+
+    def put(self, track_id, video_url, match):
+        self.put_many([(track_id, video_url, match)])
+
+    def put_many(self, resolutions):
+        now = time.time()
+        rows = [
+            (track_id, video_url, json.dumps(match), now)
+            for track_id, video_url, match in resolutions
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO resolutions"
+                " (track_id, video_url, match, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.commit()
+
+    def delete(self, track_id):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM resolutions WHERE track_id = ?", (track_id,)
+            )
+            self._connection.commit()
+
+    def export_json(self, file_path):
+        """
+        Write every resolution to a JSON file, e.g. to replay a run elsewhere.
+
+        Returns:
+            int: The number of exported resolutions.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT track_id, video_url, match FROM resolutions"
+            ).fetchall()
+        with open(file_path, "w") as f:
+            json.dump(
+                [
+                    {
+                        "track_id": track_id,
+                        "video_url": video_url,
+                        "match": json.loads(match),
+                    }
+                    for track_id, video_url, match in rows
+                ],
+                f,
+                indent=4,
+            )
+        return len(rows)
+
+    def import_json(self, file_path):
+        """
+        Add the resolutions of a file written by `export_json`.
+
+        Returns:
+            int: The number of imported resolutions.
+        """
+        with open(file_path, "r") as f:
+            entries: list[dict] = json.load(f)
+        self.put_many(
+            (entry["track_id"], entry["video_url"], entry.get("match", {}))
+            for entry in entries
+        )
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,293 @@
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+
+from config import Config
+from downloader import Downloader
+from ffmpeg_utils import OUTPUT_FORMATS, does_ffmpeg_exist, download_ffmpeg
+from matching import NoMatchError
+from progress import DONE, FAILED
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLinesWriter:
+    """Writes one JSON event per line, safe to call from any thread."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "time": time.time(), **fields})
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def create_progress_bar(self, title, progress=None):
+        """
+        Report progress like a GUI progress bar, see Downloader. The details
+        of `progress` are reported by `on_progress` instead.
+        """
+
+        def update_progress(current, total):
+            self.emit("progress", title=title, current=current, total=total)
+
+        def signal_completion():
+            self.emit("completed", title=title)
+
+        return update_progress, signal_completion
+
+    def on_progress(self, tracker, track):
+        """Progress listener of the downloader: report a track and its batch."""
+        self.emit("track_progress", batch=tracker.title, **track.to_dict())
+        if track.status in (DONE, FAILED):
+            self.emit("batch_progress", **tracker.snapshot())
+
+
+def parse_rate(value):
+    """Parse a speed in bytes per second with an optional K or M suffix."""
+    units = {"K": 1024, "M": 1024 * 1024}
+    value = value.strip().upper()
+    try:
+        if value[-1:] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate: {value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download Spotify tracks and playlists without the GUI. "
+        "Progress and results are written to stdout as JSON lines, "
+        "log messages to stderr."
+    )
+    parser.add_argument("urls", nargs="*", help="Spotify track or playlist URLs")
+    parser.add_argument(
+        "-f",
+        "--file",
+        help="file with one URL per line, '-' for stdin; "
+        "blank lines and lines starting with '#' are skipped",
+    )
+    parser.add_argument("-o", "--output", help="download directory")
+    parser.add_argument(
+        "--format", choices=sorted(OUTPUT_FORMATS), help="output audio format"
+    )
+    parser.add_argument("--workers", type=int, help="number of parallel downloads")
+    parser.add_argument(
+        "--limit-rate",
+        type=parse_rate,
+        metavar="RATE",
+        help="total download speed in bytes per second, e.g. 500K or 2M; "
+        "0 for unlimited",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="only download the tracks of playlists missing from the library",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="with --sync, delete tracks removed from the playlists",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="also resume the downloads an earlier run left unfinished",
+    )
+    parser.add_argument(
+        "--import-resolutions",
+        metavar="PATH",
+        help="before downloading, import the track-to-video matches of a file "
+        "written by --export-resolutions, so those tracks are not searched",
+    )
+    parser.add_argument(
+        "--export-resolutions",
+        metavar="PATH",
+        help="after downloading, export every known track-to-video match to PATH",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics on this localhost port while running",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="profile the stages of the first track with cProfile, "
+        "writing the stats to PATH",
+    )
+    args = parser.parse_args(argv)
+    if args.prune and not args.sync:
+        parser.error("--prune requires --sync")
+    return args
+
+
+def read_urls(file_path):
+    if file_path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(file_path, "r") as f:
+            lines = f.readlines()
+    return [
+        line.strip()
+        for line in lines
+        if line.strip() and not line.strip().startswith("#")
+    ]
+
+
+def track_result(job):
+    """Describe the outcome of a TrackJob as a JSON-serializable dict."""
+    if job.error is None:
+        status = "done"
+    elif isinstance(job.error, NoMatchError):
+        status = "unmatched"
+    else:
+        status = "failed"
+    return {
+        "id": job.track_id,
+        "title": job.title,
+        "status": status,
+        "files": job.file_paths if job.error is None else [],
+        "error": str(job.error) if job.error else None,
+    }
+
+
+def run(args, writer):
+    """
+    Download every URL and report through `writer`.
+
+    Returns:
+        int: The exit code, 1 if any track failed or was not matched, 2 if
+            the arguments or the resolutions file could not be used.
+    """
+    config = Config()
+    if args.output:
+        config.download_path = args.output
+    if args.format:
+        config.output_format = args.format
+    if args.workers:
+        config.max_thread_workers = args.workers
+    if args.limit_rate is not None:
+        config.bandwidth_limit = args.limit_rate
+    if args.metrics_port is not None:
+        config.metrics_port = args.metrics_port
+
+    urls = list(args.urls)
+    if args.file:
+        urls.extend(read_urls(args.file))
+    if not (urls or args.resume or args.import_resolutions or args.export_resolutions):
+        writer.emit("error", error="No URLs given")
+        return 2
+
+    if (urls or args.resume) and not does_ffmpeg_exist():
+        logger.info("FFmpeg not found")
+        download_ffmpeg()
+
+    downloader = Downloader(config.download_path)
+    if args.import_resolutions:
+        try:
+            count = downloader.import_resolutions(args.import_resolutions)
+        except Exception as e:
+            writer.emit("error", error=f"Could not import resolutions: {e}")
+            downloader.shutdown_executor()
+            return 2
+        writer.emit("resolutions_imported", path=args.import_resolutions, count=count)
+    if args.profile:
+        downloader.profile_next_job(args.profile)
+    counts = {"done": 0, "failed": 0, "unmatched": 0}
+    counts_lock = threading.Lock()
+
+    def on_track_done(job):
+        result = track_result(job)
+        with counts_lock:
+            counts[result["status"]] += 1
+        writer.emit("track", **result)
+
+    downloader.track_done_listeners.append(on_track_done)
+    downloader.progress_listeners.append(writer.on_progress)
+
+    batches = []
+    if args.resume:
+        batches.append(("resume", downloader.resume_unfinished, ()))
+    track_urls = [url for url in urls if "playlist" not in url]
+    if track_urls:
+        batches.append(("tracks", downloader.download_tracks, (track_urls,)))
+    for url in urls:
+        if "playlist" not in url:
+            continue
+        if args.sync:
+            sync = functools.partial(downloader.sync_playlist, prune=args.prune)
+            batches.append((url, sync, (url,)))
+        else:
+            batches.append((url, downloader.download_playlist, (url,)))
+
+    pending = []
+    export_failed = False
+    try:
+        for name, download, download_args in batches:
+            done = threading.Event()
+            total_update_progress, total_signal_completion = writer.create_progress_bar(
+                name
+            )
+
+            def signal_completion(done=done, signal=total_signal_completion):
+                signal()
+                done.set()
+
+            writer.emit("start", name=name)
+            try:
+                # Blocks while the tracks are listed and submitted
+                download(
+                    *download_args,
+                    writer.create_progress_bar,
+                    total_update_progress,
+                    signal_completion,
+                )
+            except Exception as e:
+                writer.emit("error", name=name, error=str(e))
+                with counts_lock:
+                    counts["failed"] += 1
+                continue
+            pending.append(done)
+        for done in pending:
+            done.wait()
+        if args.export_resolutions:
+            try:
+                count = downloader.export_resolutions(args.export_resolutions)
+            except OSError as e:
+                writer.emit("error", error=f"Could not export resolutions: {e}")
+                export_failed = True
+            else:
+                writer.emit(
+                    "resolutions_exported", path=args.export_resolutions, count=count
+                )
+    finally:
+        downloader.shutdown_executor()
+
+    writer.emit("summary", **counts)
+    if export_failed:
+        return 2
+    return 1 if counts["failed"] or counts["unmatched"] else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    writer = JsonLinesWriter(sys.stdout)
+    # stdout only carries JSON lines, stray prints of libraries go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        return run(args, writer)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
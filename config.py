@@ -1,7 +1,8 @@
 import json
+import logging
 import os
 
-from dotenv import load_dotenv
+logger = logging.getLogger(__name__)
 
 
 class Config:
@@ -22,6 +23,52 @@ class Config:
         self.spotify_client_secret: str | None = None
         self.download_path: str = "songs"
         self.max_thread_workers: int = 10
+        # Scale the download workers between 1 and max_thread_workers at runtime
+        self.adaptive_concurrency: bool = False
+        self.sync_prune: bool = False
+        # Download each playlist into a folder named after it, inside every
+        # output directory. Tracks in several playlists are linked, not copied.
+        self.playlist_folders: bool = False
+        # Search Spotify while typing, once typing pauses for search_debounce_ms
+        self.search_as_you_type: bool = False
+        self.search_debounce_ms: int = 400
+        # Serve the metrics on this localhost port (0 = disabled)
+        self.metrics_port: int = 0
+
+        # Total download throughput in bytes per second (0 = unlimited), and the
+        # number of connections, fragments or byte ranges, a single stream is
+        # downloaded over in parallel
+        self.bandwidth_limit: int = 0
+        self.concurrent_fragments: int = 4
+        # Requests per second to Spotify and YouTube (0 = unlimited), retries of
+        # a temporary error, and the consecutive failures that pause a source
+        self.spotify_rate_limit: float = 10
+        self.youtube_rate_limit: float = 0
+        self.max_retries: int = 4
+        self.circuit_breaker_threshold: int = 5
+        self.circuit_breaker_pause: float = 60
+        # "mp3" re-encodes, "opus" and "m4a" keep the native stream when possible
+        self.output_format: str = "mp3"
+        # Produce several formats per track, e.g. [{"format": "opus", "path": "opus"}];
+        # when empty, output_format is written to download_path
+        self.output_targets: list[dict] = []
+
+        # Search candidates ranked per track, and the accepted duration difference
+        self.search_candidates: int = 5
+        self.match_duration_tolerance: float = 15
+
+        # Spotify metadata cache, stored next to the settings file
+        self.cache_path: str = "cache.sqlite3"
+        self.cache_max_entries: int = 20000
+        self.cache_ttl_seconds: int = 7 * 24 * 60 * 60
+        # State of every queued track, to resume downloads after a restart
+        self.journal_path: str = "journal.sqlite3"
+
+        # Album cover cache, covers larger than cover_max_size are downscaled
+        self.cover_cache_dir: str = "covers"
+        self.cover_memory_budget: int = 32 * 1024 * 1024
+        self.cover_max_size: int = 0
+        self.cover_jpeg_quality: int = 90
 
         # Load settings from JSON file
         self.load()
@@ -29,22 +76,47 @@ class Config:
     def save(self):
         self._save_json_settings()
         self._save_env_variables()
-        print("Settings saved")
+        logger.info("Settings saved")
 
     def _save_json_settings(self):
-        print("Saving settings to JSON file...")
+        logger.info("Saving settings to JSON file...")
         with open(self.settings_path, "w") as f:
             json.dump(
                 {
                     "download_path": self.download_path,
                     "max_thread_workers": self.max_thread_workers,
+                    "adaptive_concurrency": self.adaptive_concurrency,
+                    "sync_prune": self.sync_prune,
+                    "playlist_folders": self.playlist_folders,
+                    "search_as_you_type": self.search_as_you_type,
+                    "search_debounce_ms": self.search_debounce_ms,
+                    "metrics_port": self.metrics_port,
+                    "bandwidth_limit": self.bandwidth_limit,
+                    "concurrent_fragments": self.concurrent_fragments,
+                    "spotify_rate_limit": self.spotify_rate_limit,
+                    "youtube_rate_limit": self.youtube_rate_limit,
+                    "max_retries": self.max_retries,
+                    "circuit_breaker_threshold": self.circuit_breaker_threshold,
+                    "circuit_breaker_pause": self.circuit_breaker_pause,
+                    "output_format": self.output_format,
+                    "output_targets": self.output_targets,
+                    "search_candidates": self.search_candidates,
+                    "match_duration_tolerance": self.match_duration_tolerance,
+                    "cache_path": self.cache_path,
+                    "cache_max_entries": self.cache_max_entries,
+                    "cache_ttl_seconds": self.cache_ttl_seconds,
+                    "journal_path": self.journal_path,
+                    "cover_cache_dir": self.cover_cache_dir,
+                    "cover_memory_budget": self.cover_memory_budget,
+                    "cover_max_size": self.cover_max_size,
+                    "cover_jpeg_quality": self.cover_jpeg_quality,
                 },
                 f,
                 indent=4,
             )
 
     def _save_env_variables(self):
-        print("Saving env variables...")
+        logger.info("Saving env variables...")
         with open(self.env_path, "w") as f:
             f.write("# DO NOT SHARE THIS FILE\n")
             f.write(f"CLIENT_ID={self.spotify_client_id}\n")
@@ -53,34 +125,89 @@ class Config:
     def load(self):
         self._load_json_settings()
         self._load_env_variables()
-        print("Settings loaded")
+        logger.info("Settings loaded")
 
     def _load_json_settings(self):
         if not os.path.exists(self.settings_path):
-            print("Settings file not found, using default settings...")
+            logger.info("Settings file not found, using default settings...")
             return
 
-        print("Loading settings from JSON file...")
+        logger.info("Loading settings from JSON file...")
         with open(self.settings_path, "r") as f:
             data: dict = json.load(f)
             self.download_path = data.get("download_path", self.download_path)
             self.max_thread_workers: int = data.get(
                 "max_thread_workers", self.max_thread_workers
             )
+            self.adaptive_concurrency = data.get(
+                "adaptive_concurrency", self.adaptive_concurrency
+            )
+            self.sync_prune = data.get("sync_prune", self.sync_prune)
+            self.playlist_folders = data.get("playlist_folders", self.playlist_folders)
+            self.search_as_you_type = data.get(
+                "search_as_you_type", self.search_as_you_type
+            )
+            self.search_debounce_ms = data.get(
+                "search_debounce_ms", self.search_debounce_ms
+            )
+            self.metrics_port = data.get("metrics_port", self.metrics_port)
+            self.bandwidth_limit = data.get("bandwidth_limit", self.bandwidth_limit)
+            self.concurrent_fragments = data.get(
+                "concurrent_fragments", self.concurrent_fragments
+            )
+            self.spotify_rate_limit = data.get(
+                "spotify_rate_limit", self.spotify_rate_limit
+            )
+            self.youtube_rate_limit = data.get(
+                "youtube_rate_limit", self.youtube_rate_limit
+            )
+            self.max_retries = data.get("max_retries", self.max_retries)
+            self.circuit_breaker_threshold = data.get(
+                "circuit_breaker_threshold", self.circuit_breaker_threshold
+            )
+            self.circuit_breaker_pause = data.get(
+                "circuit_breaker_pause", self.circuit_breaker_pause
+            )
+            self.output_format = data.get("output_format", self.output_format)
+            self.output_targets = data.get("output_targets", self.output_targets)
+            self.search_candidates = data.get(
+                "search_candidates", self.search_candidates
+            )
+            self.match_duration_tolerance = data.get(
+                "match_duration_tolerance", self.match_duration_tolerance
+            )
+            self.cache_path = data.get("cache_path", self.cache_path)
+            self.cache_max_entries = data.get(
+                "cache_max_entries", self.cache_max_entries
+            )
+            self.cache_ttl_seconds = data.get(
+                "cache_ttl_seconds", self.cache_ttl_seconds
+            )
+            self.journal_path = data.get("journal_path", self.journal_path)
+            self.cover_cache_dir = data.get("cover_cache_dir", self.cover_cache_dir)
+            self.cover_memory_budget = data.get(
+                "cover_memory_budget", self.cover_memory_budget
+            )
+            self.cover_max_size = data.get("cover_max_size", self.cover_max_size)
+            self.cover_jpeg_quality = data.get(
+                "cover_jpeg_quality", self.cover_jpeg_quality
+            )
 
     def _load_env_variables(self):
         if not os.path.exists(self.env_path):
-            print("Env file not found, skipping...")
+            logger.info("Env file not found, skipping...")
             return
 
-        print("Loading env variables...")
+        logger.info("Loading env variables...")
+        from dotenv import load_dotenv
+
         load_dotenv(self.env_path)
         spotify_client_id = os.getenv("CLIENT_ID", None)
         spotify_client_secret = os.getenv("CLIENT_SECRET", None)
 
         # Check for the string varient of the None type
         if spotify_client_id == "None" or spotify_client_secret == "None":
-            print("Spotify credentials not found")
+            logger.warning("Spotify credentials not found")
             return
 
         self.spotify_client_id = spotify_client_id
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+# The ways a file can be placed at a second path, from cheapest to dearest
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+COPY = "copy"
+
+# Linux ioctl making a file share the data blocks of another, on file systems
+# with copy-on-write support such as Btrfs and XFS
+FICLONE = 0x40049409
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _reflink(source, destination):
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        return False
+
+
+def link_file(source, destination):
+    """
+    Place the content of `source` at `destination`, sharing its data on disk
+    when the file system allows it.
+
+    A hardlink is tried first, which needs both paths on the same file system.
+    Otherwise the file is cloned with a reflink, and as a last resort copied.
+    An existing file at `destination` is replaced.
+
+    Returns:
+        str: How the file was placed, HARDLINK, REFLINK or COPY.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return HARDLINK
+    # Linked next to the destination first, so it is replaced in one step
+    temp_path = destination + ".link"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+        method = HARDLINK
+    except OSError:
+        if _reflink(source, temp_path):
+            method = REFLINK
+        else:
+            shutil.copyfile(source, temp_path)
+            method = COPY
+    os.replace(temp_path, destination)
+    return method
+
+
+class ContentStore:
+    """
+    Index of the finished output files of every track, across all folders, so
+    a track downloaded for one playlist is linked into the next instead of
+    being searched, downloaded and converted again.
+
+    Files are keyed by Spotify track ID and output format, and addressed by
+    the SHA-256 of their content. Every copy of the same content is recorded,
+    so the track can be linked as long as any of them is left. A copy is
+    checked against its hash before it is linked; copies that were changed
+    or deleted since are forgotten.
+
+    Hardlinked copies share their tags: retagging one retags all of them,
+    which is what a later retag of the same track does anyway.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS contents ("
+                " track_id TEXT NOT NULL,"
+                " format TEXT NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (track_id, format))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " sha256 TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)"
+            )
+            self._connection.commit()
+
+    def add(self, track_id, output_format, file_path):
+        """
+        Record a finished output file of a track.
+
+        Returns:
+            str: The SHA-256 of the file.
+        """
+        sha256 = hash_file(file_path)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO contents"
+                " (track_id, format, sha256, updated_at) VALUES (?, ?, ?, ?)",
+                (track_id, output_format, sha256, time.time()),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (path, sha256) VALUES (?, ?)",
+                (os.path.abspath(file_path), sha256),
+            )
+            self._connection.commit()
+        return sha256
+
+    def find(self, track_id, output_format):
+        """
+        Return an intact copy of a track's output file.
+
+        Returns:
+            str | None: The path of the copy, or None if no copy is left.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256 FROM contents WHERE track_id = ? AND format = ?",
+                (track_id, output_format),
+            ).fetchone()
+            if row is None:
+                return None
+            sha256 = row[0]
+            paths = [
+                path
+                for (path,) in self._connection.execute(
+                    "SELECT path FROM files WHERE sha256 = ?", (sha256,)
+                )
+            ]
+
+        for path in paths:
+            if os.path.exists(path) and hash_file(path) == sha256:
+                return path
+            self._forget_file(path)
+        return None
+
+    def link(self, source, destination):
+        """
+        Place a copy found by `find` at another path, see link_file.
+
+        Returns:
+            str: How the file was placed, HARDLINK, REFLINK or COPY.
+        """
+        method = link_file(source, destination)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (path, sha256)"
+                " SELECT ?, sha256 FROM files WHERE path = ?",
+                (os.path.abspath(destination), os.path.abspath(source)),
+            )
+            self._connection.commit()
+        return method
+
+    def _forget_file(self, path):
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
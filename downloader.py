@@ -1,14 +1,119 @@
 from concurrent.futures import ThreadPoolExecutor
+import cProfile
+import logging
 import os
 import re
 import threading
 
-from yt_dlp import YoutubeDL
+from adaptive import AIMDController
+from album_art import AlbumArtCache
+from bandwidth import BandwidthLimiter
+from cache import MetadataCache, ResolutionCache
+from content_store import ContentStore
+from journal import DOWNLOADED, RESOLVED, TAGGED, TRANSCODED, JobJournal
+from library import find_library_indexes, get_library_index, get_loaded_indexes
+from matching import NoMatchError, pick_best_candidate
+from metrics import MetricsServer, get_metrics
+from pipeline import DETACHED, Job, Pipeline, Stage
+from progress import ProgressTracker
+from ranged_download import RangedDownload
+from retry import Source
 from spotify_client import SpotifyClient
 from metadata import MetadataManager
 
 from config import Config
-from ffmpeg_utils import get_ffmpeg_path
+from ffmpeg_utils import OUTPUT_FORMATS, convert_audio_outputs, get_ffmpeg_executable
+
+logger = logging.getLogger(__name__)
+
+# The files the fetch stage writes: "<title>.source.<ext>", with the ".part"
+# and ".ytdl" suffixes of yt-dlp or the ".part-<start>-<end>" of a range
+SOURCE_FILE_NAME = re.compile(
+    r"(?P<name>.+)\.source\.[A-Za-z0-9]+(?:\.part(?:-\d+-\d+)?|\.ytdl)?"
+)
+
+
+class TrackJob(Job):
+    """A track moving through the download pipeline."""
+
+    def __init__(self, track, targets, update_progress=None, on_done=None):
+        """
+        Args:
+            track (str | dict): The Spotify URL of the track, or its track object.
+            targets (list[tuple[str, str]]): The output format (a key of
+                OUTPUT_FORMATS) and directory of every file to produce. The
+                source is downloaded into the first directory.
+            update_progress (function, optional): Function to update progress.
+            on_done (function, optional): Called with the job once it is done.
+        """
+        super().__init__(update_progress, on_done)
+        self.track = track
+        # Byte-level progress, when the job belongs to a ProgressTracker
+        self.tracker: ProgressTracker | None = None
+        self.progress = None
+        self.targets = targets
+        self.download_path = targets[0][1]
+        self.video_url: str | None = None
+        self.cached_resolution = False
+        self.source_path: str | None = None
+        self.source_codec: str | None = None
+        self.file_paths: list[str] = []
+        # Where to write the stats of `profiler`, see Downloader.profile_next_job
+        self.profile_path: str | None = None
+        # Jobs of the same track waiting for this one to finish, see
+        # Downloader._deduplicate
+        self.followers: list[TrackJob] | None = None
+
+    @property
+    def title(self):
+        if isinstance(self.track, str):
+            return self.track
+        return f"{self.track['name']} - {self.track['artists'][0]['name']}"
+
+    def enter_stage(self, stage):
+        super().enter_stage(stage)
+        if self.tracker:
+            self.tracker.set_stage(self.progress, stage)
+
+    @property
+    def track_id(self):
+        if isinstance(self.track, str):
+            return None
+        return self.track.get("id")
+
+    def journal_data(self):
+        """Return what the completed stages produced, to store in the journal."""
+        return {
+            "video_url": self.video_url,
+            "cached_resolution": self.cached_resolution,
+            "source_path": self.source_path,
+            "source_codec": self.source_codec,
+            "file_paths": self.file_paths,
+        }
+
+    def restore(self, data):
+        """Restore what the completed stages produced from the journal."""
+        self.video_url = data.get("video_url")
+        self.cached_resolution = data.get("cached_resolution", False)
+        self.source_path = data.get("source_path")
+        self.source_codec = data.get("source_codec")
+        self.file_paths = data.get("file_paths", [])
+
+    def resume_stage(self, state):
+        """
+        Return the first stage left to run for a job restored in `state`.
+
+        A stage is only skipped if the files it produced are still there.
+        """
+        if state == TRANSCODED and all(map(os.path.exists, self.file_paths)):
+            return "tag"
+        if state in (DOWNLOADED, TRANSCODED) and (
+            self.source_path and os.path.exists(self.source_path)
+        ):
+            return "transcode"
+        if state in (RESOLVED, DOWNLOADED, TRANSCODED) and self.video_url:
+            return "fetch"
+        return "resolve"
 
 
 class Downloader:
@@ -17,6 +122,33 @@ class Downloader:
     Handles downloading from YouTube, adding metadata, and threading.
     """
 
+    # Concurrency of each pipeline stage. Transcoding is CPU-bound and gets one
+    # FFmpeg process per core, the other stages mostly wait on the network.
+    # The fetch stage uses Config.max_thread_workers.
+    RESOLVE_WORKERS = 4
+    TRANSCODE_WORKERS = os.cpu_count() or 2
+    TAG_WORKERS = 2
+    # Number of tracks waiting in front of each stage
+    QUEUE_SIZE = 50
+
+    # Options of the long-lived YoutubeDL instances, by purpose
+    YOUTUBE_DL_OPTIONS = {
+        "search": {
+            "quiet": True,
+            "no_warnings": True,
+            "extract_flat": "in_playlist",
+        },
+        "fetch": {
+            "quiet": True,
+            "no_warnings": True,
+            # Streams yt-dlp downloads itself are fetched as ranged chunks, and
+            # fragmented ones with parallel fragments
+            "http_chunk_size": 10 * 1024 * 1024,
+            # Resume the .part file left behind by an interrupted download
+            "continuedl": True,
+        },
+    }
+
     def __init__(self, download_path):
         """
         Initialize the Downloader with a specified download path.
@@ -26,12 +158,211 @@ class Downloader:
         """
         self.config = Config()
         self.download_path = download_path
+        self.cache = MetadataCache(
+            self.config.cache_path,
+            max_entries=self.config.cache_max_entries,
+            ttl_seconds=self.config.cache_ttl_seconds,
+        )
+        self.resolutions = ResolutionCache(self.config.cache_path)
+        self.content_store = ContentStore(self.config.cache_path)
+        # The job processing each track, by track ID and output formats
+        self._in_flight: dict[tuple, TrackJob] = {}
+        self._in_flight_lock = threading.Lock()
+        self.journal = JobJournal(self.config.journal_path)
+        self.journal.remove_finished()
+        # Journal entries an earlier run left unfinished, each resumed at most
+        # once, and the job writing each entry of this run
+        self._resumable = {
+            (entry["track"]["id"], tuple(entry["targets"]))
+            for entry in self.journal.unfinished()
+        }
+        self._journal_writers: dict[tuple, TrackJob] = {}
+        # Rate limits, retries and circuit breakers shared by all workers
+        self.spotify_source = self._create_source(
+            "spotify", self.config.spotify_rate_limit
+        )
+        self.youtube_source = self._create_source(
+            "youtube", self.config.youtube_rate_limit, self._record_throttled
+        )
         self.spotify_client = SpotifyClient(
             client_id=self.config.spotify_client_id,
             client_secret=self.config.spotify_client_secret,
+            cache=self.cache,
+            source=self.spotify_source,
+        )
+        self.metadata_manager = MetadataManager(
+            AlbumArtCache(
+                self.config.cover_cache_dir,
+                metadata_cache=self.cache,
+                memory_budget=self.config.cover_memory_budget,
+                max_size=self.config.cover_max_size,
+                jpeg_quality=self.config.cover_jpeg_quality,
+            )
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.config.max_thread_workers)
+        # Shared throughput cap of all fetch workers
+        self.bandwidth = BandwidthLimiter(self.config.bandwidth_limit)
+        # Tracks skipped because no search result matched them
+        self.unmatched_tracks: list[dict] = []
+        # Tracks that failed with an error, kept to be retried in one go
+        self.failed_tracks: list[dict | str] = []
+        # Called with every TrackJob that left the pipeline, e.g. to report results
+        self.track_done_listeners: list = []
+        # Progress of the running batches, and the listeners of all of them
+        self.progress_trackers: list[ProgressTracker] = []
+        self.progress_listeners: list = []
+        self._progress_lock = threading.Lock()
+        # Jobs being downloaded, by the path of their source without extension,
+        # to attribute yt-dlp's hook calls, which may come from fragment threads
+        self._fetching: dict[str, TrackJob] = {}
+        self._unmatched_lock = threading.Lock()
+        self._youtube_dl = threading.local()
+        self._youtube_dl_instances: list = []
+        self._youtube_dl_lock = threading.Lock()
+        resolve_controller = self._create_controller("resolve", self.RESOLVE_WORKERS)
+        fetch_controller = self._create_controller(
+            "fetch", self.config.max_thread_workers
+        )
+        self.pipeline = Pipeline(
+            [
+                Stage(
+                    "resolve",
+                    self._resolve,
+                    (
+                        resolve_controller.workers
+                        if resolve_controller
+                        else self.RESOLVE_WORKERS
+                    ),
+                    resolve_controller,
+                ),
+                Stage(
+                    "fetch",
+                    self._fetch,
+                    (
+                        fetch_controller.workers
+                        if fetch_controller
+                        else self.config.max_thread_workers
+                    ),
+                    fetch_controller,
+                ),
+                Stage("transcode", self._transcode, self.TRANSCODE_WORKERS),
+                Stage("tag", self._tag, self.TAG_WORKERS),
+            ],
+            queue_size=self.QUEUE_SIZE,
+        )
+        self.metrics = get_metrics()
+        self.metrics.add_collector(self.pipeline.collect_metrics)
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics_server = None
+        if self.config.metrics_port:
+            self.start_metrics_server(self.config.metrics_port)
+        # Where to write the profile of the next queued job, see profile_next_job
+        self._profile_path: str | None = None
+
+    def start_metrics_server(self, port=0):
+        """
+        Serve the metrics on localhost, see MetricsServer.
+
+        Args:
+            port (int, optional): The port, 0 for any free port.
+
+        Returns:
+            MetricsServer: The server, its `port` is the one listened on.
+        """
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(self.metrics, port)
+        return self.metrics_server
+
+    def _collect_metrics(self):
+        """Metrics collector: the throughput and size of the running batches."""
+        snapshots = self.get_progress()
+        running = sum(
+            snapshot["tracks"] - snapshot["completed"] - snapshot["failed"]
+            for snapshot in snapshots
         )
-        self.metadata_manager = MetadataManager()
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        return [
+            ("batches_running", {}, len(snapshots)),
+            ("tracks_pending", {}, running),
+            ("download_speed_bytes", {}, sum(s["speed"] for s in snapshots)),
+        ]
+
+    def profile_next_job(self, path):
+        """
+        Profile the stages of the next queued track with cProfile.
+
+        The stats are written to `path` once the track has left the pipeline,
+        to be read with pstats or a viewer like snakeviz. Only the stage
+        handlers of that track are profiled; since Python 3.12 the profiler
+        may also record what other threads run while a handler is profiled.
+
+        Args:
+            path (str): The file to write the stats to.
+        """
+        with self._progress_lock:
+            self._profile_path = path
+
+    def _create_source(self, name, requests_per_second, on_throttled=None):
+        """
+        Create the shared rate limit and retry policy of a remote service.
+
+        Args:
+            name (str): The name of the service.
+            requests_per_second (float): The highest call rate, zero for unlimited.
+            on_throttled (function, optional): Called when the service throttles us.
+
+        Returns:
+            Source: The source to make every call to the service through.
+        """
+        return Source(
+            name,
+            requests_per_second=requests_per_second,
+            max_retries=self.config.max_retries,
+            failure_threshold=self.config.circuit_breaker_threshold,
+            pause_seconds=self.config.circuit_breaker_pause,
+            on_throttled=on_throttled,
+        )
+
+    def _record_throttled(self):
+        """Let the adaptive controllers back off when YouTube throttles a retry."""
+        for stage in ("resolve", "fetch"):
+            controller = self.pipeline.get_stage(stage).controller
+            if controller:
+                controller.record_throttled()
+
+    def _create_controller(self, stage, maximum):
+        """
+        Create the adaptive concurrency controller of a network-bound stage.
+
+        In adaptive mode the stage starts at half its maximum workers and is
+        scaled between one and the maximum based on throughput, latency and
+        throttling errors.
+
+        Returns:
+            AIMDController | None: The controller, or None if adaptive mode is off.
+        """
+        if not self.config.adaptive_concurrency:
+            return None
+        return AIMDController(
+            lambda workers: self.pipeline.set_workers(stage, workers),
+            max(1, maximum // 2),
+            maximum=maximum,
+        )
+
+    def set_max_workers(self, workers):
+        """
+        Change the number of parallel downloads, also while a playlist is running.
+
+        In adaptive mode this is the highest number the controller may use.
+
+        Args:
+            workers (int): The new number of workers.
+        """
+        self.config.max_thread_workers = workers
+        fetch_stage = self.pipeline.get_stage("fetch")
+        if fetch_stage.controller:
+            fetch_stage.controller.set_maximum(workers)
+        else:
+            self.pipeline.set_workers("fetch", workers)
 
     @staticmethod
     def sanitize_filename(filename):
@@ -46,74 +377,624 @@ class Downloader:
         """
         return re.sub(r'[<>:"/\\|?*]', "", filename)
 
-    def download_song(self, song_name, artist_name):
+    def get_youtube_dl(self, purpose, format_spec=None):
+        """
+        Return the calling thread's YoutubeDL instance for a purpose.
+
+        Creating a YoutubeDL loads the extractors and sets up a cookie jar and
+        HTTP handlers, so every worker thread keeps its instances for all the
+        tracks it handles instead of creating one per track.
+
+        Args:
+            purpose (str): "search" or "fetch", see YOUTUBE_DL_OPTIONS.
+            format_spec (str, optional): The format selector, which yt-dlp only
+                parses when the instance is created.
+
+        Returns:
+            YoutubeDL: The instance, only to be used from the calling thread.
+        """
+        if not hasattr(self._youtube_dl, "instances"):
+            self._youtube_dl.instances = {}
+        ydl = self._youtube_dl.instances.get((purpose, format_spec))
+        if ydl is None:
+            # yt-dlp takes a quarter of a second to import, only pay for it
+            # once the first track is searched
+            from yt_dlp import YoutubeDL
+
+            # Copy the options, yt-dlp normalizes some of them in place
+            options = dict(self.YOUTUBE_DL_OPTIONS[purpose])
+            if format_spec:
+                options["format"] = format_spec
+            if purpose == "fetch":
+                options["progress_hooks"] = [
+                    self.bandwidth.progress_hook,
+                    self._progress_hook,
+                ]
+                options["postprocessor_hooks"] = [self._postprocessor_hook]
+                options["concurrent_fragment_downloads"] = (
+                    self.config.concurrent_fragments
+                )
+                # yt-dlp runs FFmpeg itself to fix up and merge streams, and
+                # finds FFprobe next to it
+                ffmpeg = get_ffmpeg_executable()
+                if ffmpeg:
+                    options["ffmpeg_location"] = ffmpeg
+            ydl = YoutubeDL(options)
+            self._youtube_dl.instances[(purpose, format_spec)] = ydl
+            with self._youtube_dl_lock:
+                self._youtube_dl_instances.append(ydl)
+        return ydl
+
+    def _fetching_job(self, file_path):
+        if not file_path:
+            return None
+        return self._fetching.get(file_path.partition(".source.")[0])
+
+    def _progress_hook(self, status):
+        """yt-dlp progress hook: pass the download progress to the job's tracker."""
+        job = self._fetching_job(status.get("filename"))
+        if job is None or job.tracker is None:
+            return
+        job.tracker.update_download(
+            job.progress,
+            status.get("downloaded_bytes") or 0,
+            status.get("total_bytes") or status.get("total_bytes_estimate"),
+            status.get("speed"),
+            status.get("eta"),
+        )
+
+    def _postprocessor_hook(self, status):
+        """yt-dlp postprocessor hook: show which fixup runs after a download."""
+        info = status.get("info_dict") or {}
+        job = self._fetching_job(info.get("filepath") or info.get("_filename"))
+        if job is None or job.tracker is None:
+            return
+        running = status.get("status") != "finished"
+        job.tracker.set_postprocessor(
+            job.progress, status.get("postprocessor") if running else None
+        )
+
+    def create_tracker(self, title):
+        """
+        Start tracking the progress of a batch of tracks.
+
+        Returns:
+            ProgressTracker: The tracker, listed in `progress_trackers` until
+                `finish_tracker` is called.
         """
-        Download a song from YouTube based on the song name and artist name.
+        tracker = ProgressTracker(title, self.progress_listeners)
+        with self._progress_lock:
+            self.progress_trackers.append(tracker)
+        return tracker
+
+    def finish_tracker(self, tracker):
+        tracker.close()
+        with self._progress_lock:
+            if tracker in self.progress_trackers:
+                self.progress_trackers.remove(tracker)
+
+    def get_progress(self):
+        """Return the snapshots of the running batches, see ProgressTracker."""
+        with self._progress_lock:
+            trackers = list(self.progress_trackers)
+        return [tracker.snapshot() for tracker in trackers]
+
+    def search_videos(self, query, limit):
+        """
+        Search YouTube for videos, fetching only their flat metadata.
 
         Args:
-            song_name (str): The name of the song.
-            artist_name (str): The name of the artist.
+            query (str): The search query.
+            limit (int): The maximum number of results.
 
         Returns:
-            str: The path to the downloaded MP3 file.
+            list[dict]: The flat search results, each with at least its `url`,
+                `id` and `title`, and usually its `duration` and `channel`.
+        """
+        with self.metrics.time("youtube_search_seconds"):
+            results = self.youtube_source.call(
+                self.get_youtube_dl("search").extract_info,
+                f"ytsearch{limit}:{query}",
+                download=False,
+            )
+        return results.get("entries") or []
+
+    def find_video(self, track):
+        """
+        Find the video that best matches a Spotify track.
+
+        Several candidates are ranked on their duration, title, artist and
+        ISRC before anything is downloaded. If the name search has no
+        acceptable candidate, the ISRC is searched for as well.
+
+        Args:
+            track (dict): The Spotify track object.
+
+        Returns:
+            tuple[dict, str]: The flat search result and the query that found it.
 
         Raises:
-            Exception: If the download fails.
+            NoMatchError: If no candidate is within the duration tolerance.
         """
-        sanitized_name = self.sanitize_filename(f"{song_name} - {artist_name}")
-        output_template = os.path.join(self.download_path, f"{sanitized_name}.%(ext)s")
-        ydl_opts = {
-            "format": "bestaudio/best",
-            "outtmpl": output_template,
-            "quiet": True,
-            "no_warnings": True,
-            "postprocessors": [
+        queries = [f"{track['name']} {track['artists'][0]['name']}"]
+        isrc = track.get("external_ids", {}).get("isrc")
+        if isrc:
+            queries.append(f'"{isrc}"')
+
+        error = None
+        for query in queries:
+            entries = self.search_videos(query, self.config.search_candidates)
+            try:
+                entry = pick_best_candidate(
+                    track, entries, self.config.match_duration_tolerance
+                )
+                return entry, query
+            except NoMatchError as e:
+                error = error or e
+        raise error
+
+    def fetch_audio(self, video_url, download_path, name, output_format="mp3"):
+        """
+        Download the best audio stream of a video as-is.
+
+        A stream that is a single file is downloaded over several connections
+        (Config.concurrent_fragments) when the server answers range requests,
+        other streams by yt-dlp.
+
+        Args:
+            video_url (str): The URL of the video.
+            download_path (str): The directory to download into.
+            name (str): The file name, without extension.
+            output_format (str, optional): The format the audio will be converted
+                to; streams that can be remuxed into it are preferred.
+
+        Returns:
+            tuple[str, str]: The path to the downloaded file and its audio codec.
+        """
+        ydl = self.get_youtube_dl(
+            "fetch", OUTPUT_FORMATS[output_format]["source_format"]
+        )
+        # The output template is the only option that changes between tracks
+        ydl.params["outtmpl"]["default"] = os.path.join(
+            download_path, f"{name}.source.%(ext)s"
+        )
+        info = self.youtube_source.call(ydl.extract_info, video_url, download=False)
+        file_path = ydl.prepare_filename(info)
+        if self.youtube_source.call(self._fetch_ranges, ydl, info, file_path):
+            return file_path, info.get("acodec")
+        info = self.youtube_source.call(ydl.process_ie_result, info, download=True)
+        download = info["requested_downloads"][0]
+        return download["filepath"], download.get("acodec")
+
+    def _fetch_ranges(self, ydl, info, file_path):
+        """
+        Download the selected format of a video in parallel ranges, see
+        RangedDownload.
+
+        Returns:
+            bool: Whether the format was downloaded; False if it is not a
+                single file over HTTP, is too small to split, or the server
+                does not answer range requests.
+        """
+        if (
+            self.config.concurrent_fragments < 2
+            or info.get("requested_formats")
+            or info.get("protocol") not in ("http", "https")
+        ):
+            return False
+        from yt_dlp.networking import Request
+
+        headers = info.get("http_headers") or {}
+        download = RangedDownload(
+            lambda url, range_headers: ydl.urlopen(
+                Request(url, headers={**headers, **range_headers})
+            ),
+            info["url"],
+            file_path,
+            self.config.concurrent_fragments,
+            total_bytes=info.get("filesize"),
+            on_data=self.bandwidth.bucket.consume,
+            progress_hook=self._progress_hook,
+        )
+        ranges = download.plan()
+        if not ranges:
+            return False
+        download.run(ranges)
+        self.metrics.increment("ranged_downloads_total")
+        return True
+
+    def _resolve(self, job):
+        """Pipeline stage: resolve the Spotify track and find its video."""
+        if isinstance(job.track, str):
+            job.track = self.spotify_client.get_track_info(job.track)
+            if job.progress:
+                job.progress.title = job.title
+            if job.track_id and self._claim_journal_entry(job):
+                self.journal.add(job.track_id, job.track, job.targets)
+        if self._deduplicate(job):
+            return DETACHED
+        track_id = job.track_id
+        resolution = self.resolutions.get(track_id) if track_id else None
+        self.metrics.increment(
+            "resolution_cache_total", result="hit" if resolution else "miss"
+        )
+        if resolution:
+            logger.info("[%s] Using known video %s", job.title, resolution["video_url"])
+            job.video_url = resolution["video_url"]
+            job.cached_resolution = True
+            self._record_state(job, RESOLVED)
+            return
+
+        logger.info("[%s] Searching...", job.title)
+        try:
+            entry, query = self.find_video(job.track)
+        except NoMatchError as e:
+            with self._unmatched_lock:
+                self.unmatched_tracks.append(job.track)
+            logger.warning("[%s] No acceptable match: %s", job.title, e)
+            raise
+        job.video_url = entry["url"]
+        if track_id:
+            self.resolutions.put(
+                track_id,
+                job.video_url,
                 {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                    "preferredquality": "192",
-                }
-            ],
-            "ffmpeg_location": get_ffmpeg_path(),
-        }
-        search_query = f"ytsearch:{song_name} {artist_name}"
+                    "video_id": entry.get("id"),
+                    "title": entry.get("title"),
+                    "channel": entry.get("channel"),
+                    "duration": entry.get("duration"),
+                    "query": query,
+                },
+            )
+        self._record_state(job, RESOLVED)
+
+    def _fetch(self, job):
+        """Pipeline stage: download the audio stream of the video."""
+        logger.info("[%s] Downloading...", job.title)
+        os.makedirs(job.download_path, exist_ok=True)
+        name = self.sanitize_filename(job.title)
+        fetching_key = os.path.join(job.download_path, name)
+        self._fetching[fetching_key] = job
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                print(f"[{song_name} - {artist_name}] Downloading...")
-                ydl.download([search_query])
-                print(f"[{song_name} - {artist_name}] Downloaded")
-            return os.path.join(self.download_path, f"{sanitized_name}.mp3")
-        except Exception as e:
-            print(f"[{song_name} - {artist_name}] Failed to download: {e}")
-            raise Exception(f"Failed to download '{song_name}' by '{artist_name}': {e}")
+            job.source_path, job.source_codec = self.fetch_audio(
+                job.video_url,
+                job.download_path,
+                name,
+                # Prefer a stream the first output can keep without re-encoding
+                job.targets[0][0],
+            )
+        except Exception:
+            # The known video may have been removed, search again next time
+            if job.cached_resolution:
+                self.resolutions.delete(job.track["id"])
+            raise
+        finally:
+            self._fetching.pop(fetching_key, None)
+        self._record_state(job, DOWNLOADED)
+        logger.info("[%s] Downloaded", job.title)
+
+    def _transcode(self, job):
+        """
+        Pipeline stage: remux or encode the downloaded audio to every output
+        format, decoding the source only once.
+        """
+        name = self.sanitize_filename(job.title)
+        outputs = []
+        for output_format, directory in job.targets:
+            os.makedirs(directory, exist_ok=True)
+            outputs.append(
+                (os.path.join(directory, f"{name}.{output_format}"), output_format)
+            )
+        logger.info("[%s] Converting...", job.title)
+        convert_audio_outputs(job.source_path, outputs, job.source_codec)
+        job.file_paths = [file_path for file_path, _ in outputs]
+        self._record_state(job, TRANSCODED)
+        # Only removed once the journal no longer points at it
+        os.remove(job.source_path)
+
+    def _tag(self, job):
+        """Pipeline stage: tag every output and record the track in its library."""
+        logger.info("[%s] Adding metadata...", job.title)
+        for file_path in job.file_paths:
+            self.metadata_manager.add_metadata(file_path, job.track)
+        logger.info("[%s] Metadata added", job.title)
+        if job.track_id:
+            for file_path, (output_format, _) in zip(job.file_paths, job.targets):
+                self.content_store.add(job.track_id, output_format, file_path)
+        self._add_to_libraries(job)
+        self._record_state(job, TAGGED)
+        logger.info("[%s] Done", job.title)
+
+    def _add_to_libraries(self, job):
+        if job.track_id:
+            for file_path, (_, directory) in zip(job.file_paths, job.targets):
+                get_library_index(directory).add_track(job.track_id, file_path)
+
+    @staticmethod
+    def _content_key(job):
+        if not job.track_id:
+            return None
+        return job.track_id, tuple(output_format for output_format, _ in job.targets)
+
+    def _deduplicate(self, job):
+        """
+        Make sure every track is only processed once, however many playlists
+        or batches it is in.
+
+        A job whose track is already being processed by another job waits for
+        that job and gets its files linked from it. Otherwise the job becomes
+        the one processing the track; if the content store has the track's
+        files from an earlier download, they are linked right away.
+
+        Returns:
+            bool: Whether the job was taken out of the pipeline, to be finished
+                by `_job_done` of the job processing its track.
+        """
+        key = self._content_key(job)
+        if key is None:
+            return False
+        with self._in_flight_lock:
+            owner = self._in_flight.get(key)
+            if owner is not None:
+                owner.followers.append(job)
+                logger.info("[%s] Already being downloaded, waiting", job.title)
+                self.metrics.increment("deduplicated_tracks_total", source="in_flight")
+                return True
+            job.followers = []
+            self._in_flight[key] = job
+
+        if not self._link_outputs(job):
+            return False
+        logger.info("[%s] Linked from an earlier download", job.title)
+        self.metrics.increment("deduplicated_tracks_total", source="content_store")
+        self.pipeline.complete(job)
+        return True
+
+    def _link_outputs(self, job):
+        """
+        Link every output of a job from the content store.
+
+        Returns:
+            bool: Whether the job is done; nothing is linked unless the store
+                has every output.
+        """
+        sources = [
+            self.content_store.find(job.track_id, output_format)
+            for output_format, _ in job.targets
+        ]
+        if not all(sources):
+            return False
+        name = self.sanitize_filename(job.title)
+        file_paths = []
+        for source, (output_format, directory) in zip(sources, job.targets):
+            os.makedirs(directory, exist_ok=True)
+            file_path = os.path.join(directory, f"{name}.{output_format}")
+            method = self.content_store.link(source, file_path)
+            self.metrics.increment("content_links_total", method=method)
+            file_paths.append(file_path)
+        job.file_paths = file_paths
+        self._add_to_libraries(job)
+        self._record_state(job, TAGGED)
+        return True
+
+    def _release_followers(self, job):
+        """Finish the jobs that waited for `job` to process their track."""
+        with self._in_flight_lock:
+            if self._in_flight.get(self._content_key(job)) is job:
+                del self._in_flight[self._content_key(job)]
+            followers, job.followers = job.followers, None
+        for follower in followers:
+            if job.error is not None:
+                follower.error = job.error
+            else:
+                try:
+                    if not self._link_outputs(follower):
+                        follower.error = Exception(
+                            "The files of the track were removed before they "
+                            "could be linked"
+                        )
+                except Exception as e:
+                    follower.error = e
+            self.pipeline.complete(follower)
+
+    @staticmethod
+    def _journal_key(job):
+        return job.track_id, tuple(tuple(target) for target in job.targets)
+
+    def _claim_journal_entry(self, job):
+        """
+        Make a job the writer of its journal entry, unless another running job
+        of the same track and targets already is.
+
+        Only one job writes an entry, so the state and data recorded in it
+        always come from the same job.
+
+        Returns:
+            bool: Whether the job writes the entry.
+        """
+        key = self._journal_key(job)
+        with self._in_flight_lock:
+            writer = self._journal_writers.get(key)
+            if writer is not None and writer is not job:
+                return False
+            self._journal_writers[key] = job
+            return True
+
+    def _release_journal_entry(self, job):
+        key = self._journal_key(job)
+        with self._in_flight_lock:
+            if self._journal_writers.get(key) is job:
+                del self._journal_writers[key]
 
-    def download_track(self, track_url, update_progress=None):
+    def _record_state(self, job, state):
+        """Record in the journal that a job completed the stage leading to `state`."""
+        if job.track_id and self._journal_writers.get(self._journal_key(job)) is job:
+            self.journal.update(job.track_id, job.targets, state, job.journal_data())
+
+    def download_track(self, track, update_progress=None):
         """
-        Download a single track from a Spotify URL.
+        Download a single track from a Spotify URL or a resolved track object.
 
         Args:
-            track_url (str): The Spotify URL of the track.
+            track (str | dict): The Spotify URL of the track, or a track object
+                already returned by Spotify (e.g. from a playlist listing).
             update_progress (function, optional): Function to update progress.
+
+        Returns:
+            str: The path to the downloaded file, or to the first output when
+                several output targets are configured.
         """
-        track_info = self.spotify_client.get_track_info(track_url)
-        song_name = track_info["name"]
-        artist_name = track_info["artists"][0]["name"]
-        album_name = track_info["album"]["name"]
-        album_art_url = track_info["album"]["images"][0]["url"]
+        tracker = self.create_tracker("Track")
+        job, stage = self._create_job(
+            track,
+            self.get_output_targets(),
+            update_progress,
+            self._job_done,
+            tracker,
+        )
+        tracker.close()
+        if stage:
+            self.pipeline.submit(job, stage)
+        job.wait()
+        self.finish_tracker(tracker)
+        if job.error:
+            raise job.error
+        return job.file_paths[0]
 
-        if update_progress:
-            update_progress(0, 1)
+    def retag_library(self, max_workers=None):
+        """
+        Rewrite the tags of every track in the library from fresh Spotify data.
 
-        file_path = self.download_song(song_name, artist_name)
-        print(f"[{song_name} - {artist_name}] Adding metadata...")
-        self.metadata_manager.add_metadata(
-            file_path, song_name, artist_name, album_name, album_art_url
+        Args:
+            max_workers (int, optional): The number of files tagged at once.
+                Defaults to the configured number of workers.
+
+        Returns:
+            dict: The exception raised for every file that could not be tagged.
+        """
+        libraries = self.get_libraries()
+        for _, directory in self.get_output_targets():
+            libraries.extend(find_library_indexes(directory))
+        track_ids = {
+            track_id
+            for library in libraries
+            for track_id in list(library.tracks)
+            if library.has_track(track_id)
+        }
+        tracks = self.spotify_client.iter_tracks_info(list(track_ids))
+        files = [
+            (library.get_file(track["id"]), track)
+            for track in tracks
+            for library in libraries
+            if library.has_track(track["id"])
+        ]
+        # A track hardlinked into several folders is one file on disk, which is
+        # tagged once instead of by several workers at the same time
+        unique_files = {}
+        tagged_paths = {}
+        for file_path, track in files:
+            stat = os.stat(file_path)
+            inode = (stat.st_dev, stat.st_ino)
+            unique_files.setdefault(inode, (file_path, track))
+            tagged_paths[file_path] = unique_files[inode][0]
+        tag_errors = self.metadata_manager.add_metadata_batch(
+            list(unique_files.values()),
+            max_workers=max_workers or self.config.max_thread_workers,
         )
-        print(f"[{song_name} - {artist_name}] Metadata added")
+        errors = {}
+        # The new tags change the content the store knows the files by
+        for file_path, track in files:
+            error = tag_errors.get(tagged_paths[file_path])
+            if error:
+                errors[file_path] = error
+                continue
+            output_format = os.path.splitext(file_path)[1][1:].lower()
+            self.content_store.add(track["id"], output_format, file_path)
+        return errors
 
-        if update_progress:
-            update_progress(1, 1)
-        print(f"[{song_name} - {artist_name}] Done")
+    def set_bandwidth_limit(self, rate):
+        """
+        Change the total download throughput of all workers, at any time.
+
+        Args:
+            rate (int): The allowed bytes per second, zero for unlimited.
+        """
+        self.config.bandwidth_limit = rate
+        self.bandwidth.set_rate(rate)
+
+    def export_resolutions(self, file_path):
+        """
+        Export the known track-to-video resolutions to a JSON file.
+
+        A run can be replayed on another machine without any search traffic by
+        importing the file there.
+
+        Returns:
+            int: The number of exported resolutions.
+        """
+        return self.resolutions.export_json(file_path)
+
+    def import_resolutions(self, file_path):
+        """
+        Import track-to-video resolutions exported by `export_resolutions`.
+
+        Returns:
+            int: The number of imported resolutions.
+        """
+        return self.resolutions.import_json(file_path)
+
+    def get_output_targets(self, folder=None):
+        """
+        Return the format and directory of every file produced per track.
+
+        Args:
+            folder (str, optional): A subfolder of every directory to use
+                instead, e.g. the folder of a playlist.
+
+        Returns:
+            list[tuple[str, str]]: The configured output targets, or the output
+                format in the download path when none are configured.
+        """
+        if self.config.output_targets:
+            targets = [
+                (target["format"], target["path"])
+                for target in self.config.output_targets
+            ]
+        else:
+            targets = [(self.config.output_format, self.download_path)]
+        if folder:
+            targets = [
+                (output_format, os.path.join(directory, folder))
+                for output_format, directory in targets
+            ]
+        return targets
+
+    def get_playlist_targets(self, playlist_url):
+        """Return the output targets of a playlist, see `playlist_folders`."""
+        if not self.config.playlist_folders:
+            return self.get_output_targets()
+        name = self.spotify_client.get_playlist_name(playlist_url)
+        folder = self.sanitize_filename(name).strip(" .") or (
+            self.spotify_client.extract_id(playlist_url)
+        )
+        return self.get_output_targets(folder)
+
+    def get_libraries(self, targets=None):
+        """Return the index of every output target's directory."""
+        return [
+            get_library_index(directory)
+            for _, directory in targets or self.get_output_targets()
+        ]
+
+    def get_library(self, targets=None):
+        """Return the index of the first output target, which also keeps the sync state."""
+        return self.get_libraries(targets)[0]
+
+    def has_track(self, track_id, targets=None):
+        """Check whether a track is in the library of every output target."""
+        return all(
+            library.has_track(track_id) for library in self.get_libraries(targets)
+        )
 
     def download_playlist(
         self,
@@ -123,75 +1004,499 @@ class Downloader:
         total_signal_completion,
     ):
         """
-        Download all tracks in a Spotify playlist URL using the thread pool.
+        Download all tracks in a Spotify playlist URL through the pipeline.
+
+        Args:
+            playlist_url (str): The Spotify URL of the playlist.
+            create_progress_bar (function): Function to create progress bars.
+            total_update_progress (function): Function to update total progress.
+            total_signal_completion (function): Function to signal total completion.
+        """
+        tracks = (
+            item["track"]
+            for item in self.spotify_client.iter_playlist_tracks(playlist_url)
+        )
+        self._download_tracks(
+            tracks,
+            create_progress_bar,
+            total_update_progress,
+            total_signal_completion,
+            f"Playlist {self.spotify_client.extract_id(playlist_url)}",
+            self.get_playlist_targets(playlist_url),
+        )
+
+    def sync_playlist(
+        self,
+        playlist_url,
+        create_progress_bar,
+        total_update_progress,
+        total_signal_completion,
+        prune=False,
+    ):
+        """
+        Download only the tracks of a playlist that are not in the library yet.
+
+        If the playlist's snapshot ID is unchanged since the last complete sync
+        and all its files still exist, nothing else is requested. Tracks
+        without an acceptable video count as synced, searching for them again
+        would find the same videos; they are retried once the playlist changes.
 
         Args:
             playlist_url (str): The Spotify URL of the playlist.
             create_progress_bar (function): Function to create progress bars.
             total_update_progress (function): Function to update total progress.
             total_signal_completion (function): Function to signal total completion.
+            prune (bool, optional): Whether to delete the files of tracks removed
+                from the playlist, unless another synced playlist still has them.
+        """
+        targets = self.get_playlist_targets(playlist_url)
+        library = self.get_library(targets)
+        playlist_id = self.spotify_client.extract_id(playlist_url)
+        snapshot_id = self.spotify_client.get_playlist_snapshot_id(playlist_url)
+        previous = library.get_playlist(playlist_id)
+        if (
+            previous
+            and previous["snapshot_id"] == snapshot_id
+            and all(
+                self.has_track(track_id, targets)
+                or track_id in previous.get("unmatched_ids", ())
+                for track_id in previous["track_ids"]
+            )
+        ):
+            logger.info("[%s] Playlist is up to date", playlist_id)
+            total_update_progress(1, 1)
+            total_signal_completion()
+            return
+
+        track_ids = []
+
+        def new_tracks():
+            for item in self.spotify_client.iter_playlist_tracks(
+                playlist_url, snapshot_id
+            ):
+                track = item["track"]
+                # Local files have no ID and cannot be downloaded
+                if not track.get("id"):
+                    continue
+                track_ids.append(track["id"])
+                if not self.has_track(track["id"], targets):
+                    yield track
+
+        def sync_completed():
+            if prune and previous:
+                for track_id in set(previous["track_ids"]) - set(track_ids):
+                    if not library.is_referenced(track_id, playlist_id):
+                        logger.info("[%s] Removing track %s", playlist_id, track_id)
+                        for target_library in self.get_libraries(targets):
+                            target_library.remove_track(track_id)
+
+            # Failed tracks are retried by the next sync, so the snapshot is only
+            # recorded once every track is in the library or has no match
+            with self._unmatched_lock:
+                unmatched = {track["id"] for track in self.unmatched_tracks}
+            missing = [
+                track_id
+                for track_id in track_ids
+                if not self.has_track(track_id, targets)
+            ]
+            if all(track_id in unmatched for track_id in missing):
+                library.set_playlist(playlist_id, snapshot_id, track_ids, missing)
+            for target_library in self.get_libraries(targets):
+                target_library.save()
+            total_signal_completion()
+
+        self._download_tracks(
+            new_tracks(),
+            create_progress_bar,
+            total_update_progress,
+            sync_completed,
+            f"Playlist {playlist_id}",
+            targets,
+        )
+
+    def download_tracks(
+        self,
+        track_urls,
+        create_progress_bar,
+        total_update_progress,
+        total_signal_completion,
+    ):
+        """
+        Download a list of Spotify track URLs through the pipeline.
+
+        The tracks are resolved in batches instead of one request per URL.
+
+        Args:
+            track_urls (list[str]): The Spotify URLs of the tracks.
+            create_progress_bar (function): Function to create progress bars.
+            total_update_progress (function): Function to update total progress.
+            total_signal_completion (function): Function to signal total completion.
+        """
+        tracks = self.spotify_client.iter_tracks_info(track_urls)
+        self._download_tracks(
+            tracks, create_progress_bar, total_update_progress, total_signal_completion
+        )
+
+    def retry_failed(
+        self,
+        create_progress_bar,
+        total_update_progress,
+        total_signal_completion,
+    ):
+        """
+        Download every track that failed with an error again.
+
+        The failed tracks are taken off the list; those failing again are
+        added back to it.
+
+        Args:
+            create_progress_bar (function): Function to create progress bars.
+            total_update_progress (function): Function to update total progress.
+            total_signal_completion (function): Function to signal total completion.
         """
-        tracks = self.spotify_client.get_playlist_tracks(playlist_url)
-        total_tracks = len(tracks)
+        with self._unmatched_lock:
+            failed, self.failed_tracks = self.failed_tracks, []
+
+        def tracks():
+            yield from (track for track in failed if isinstance(track, dict))
+            # Tracks whose Spotify lookup failed are still URLs
+            yield from self.spotify_client.iter_tracks_info(
+                [track for track in failed if isinstance(track, str)]
+            )
+
+        self._download_tracks(
+            tracks(),
+            create_progress_bar,
+            total_update_progress,
+            total_signal_completion,
+            "Retry failed",
+        )
+
+    def _download_tracks(
+        self,
+        tracks,
+        create_progress_bar,
+        total_update_progress,
+        total_signal_completion,
+        title="Tracks",
+        targets=None,
+    ):
+        """
+        Submit resolved track objects to the download pipeline as they arrive.
+
+        Args:
+            tracks (iterable[dict | tuple[dict, list]]): The Spotify track
+                objects to download, or (track, targets) pairs for tracks with
+                their own output targets.
+            create_progress_bar (function): Function to create progress bars,
+                called with the track title and its TrackProgress.
+            total_update_progress (function): Function to update total progress.
+            total_signal_completion (function): Function to signal total completion.
+            title (str, optional): The name of the batch in the progress model.
+            targets (list[tuple[str, str]], optional): The output targets.
+                Defaults to the configured ones.
+        """
+        # Tracks are submitted while later pages are still being fetched, so the
+        # total only becomes final once every track has been listed.
+        lock = threading.Lock()
+        total_tracks = 0
+        completed_tracks = 0
+        listing_done = False
 
         # Initialize total progress
         total_update_progress(0, total_tracks)
+        targets = targets or self.get_output_targets()
+        # The directories of every target the tracks were submitted with
+        directories = {directory for _, directory in targets}
+        tracker = self.create_tracker(title)
 
-        completed_tracks = 0
+        def all_completed():
+            self.finish_tracker(tracker)
+            for directory in directories:
+                get_library_index(directory).save()
+            with self._unmatched_lock:
+                unmatched = [track["name"] for track in self.unmatched_tracks]
+                failed = len(self.failed_tracks)
+            if unmatched:
+                logger.warning(
+                    "No acceptable match for %d tracks: %s", len(unmatched), unmatched
+                )
+            if failed:
+                logger.warning("%d tracks failed, they can be retried", failed)
+            total_signal_completion()
 
         def track_completed():
             nonlocal completed_tracks
-            completed_tracks += 1
-            total_update_progress(completed_tracks, total_tracks)
-            if completed_tracks == total_tracks:
-                total_signal_completion()
-
-        for item in tracks:
-            track = item["track"]
-            track_url = track["external_urls"]["spotify"]
+            with lock:
+                completed_tracks += 1
+                total_update_progress(completed_tracks, total_tracks)
+                finished = listing_done and completed_tracks == total_tracks
+            if finished:
+                all_completed()
+
+        for track in tracks:
+            track_targets = targets
+            if isinstance(track, tuple):
+                track, track_targets = track
+                directories.update(directory for _, directory in track_targets)
             song_name = track["name"]
             artist_name = track["artists"][0]["name"]
 
             # Create progress bar for the track
             track_title = f"{song_name} by {artist_name}"
+            progress = tracker.add_track(track_title)
             track_update_progress, track_signal_completion = create_progress_bar(
-                track_title
+                track_title, progress
             )
 
-            # Submit the download task to the thread pool
-            self.executor.submit(
-                self._download_track_wrapper,
-                track_url,
+            with lock:
+                total_tracks += 1
+                total_update_progress(completed_tracks, total_tracks)
+
+            job, stage = self._create_job(
+                track,
+                track_targets,
                 track_update_progress,
-                track_signal_completion,
-                track_completed,
+                self._track_done_callback(track_signal_completion, track_completed),
+                tracker,
+                progress,
             )
+            # Submit the track to the pipeline, this blocks while it is saturated
+            if stage:
+                self.pipeline.submit(job, stage)
 
-    def _download_track_wrapper(
-        self, track_url, update_progress, signal_completion, track_completed
+        tracker.close()
+        with lock:
+            listing_done = True
+            finished = completed_tracks == total_tracks
+        if finished:
+            all_completed()
+
+    def _create_job(
+        self,
+        track,
+        targets,
+        update_progress=None,
+        on_done=None,
+        tracker=None,
+        progress=None,
     ):
         """
-        Wrapper function to download a track and handle completion signals.
+        Create the job of a track, resuming it if an earlier run left it
+        unfinished.
+
+        A track is resumed from its last completed stage when it was queued
+        with the same output targets; otherwise it is recorded as pending,
+        unless a running job of the same track and targets has the entry. A
+        job resumed past the resolve stage is deduplicated here, as `_resolve`
+        would have.
+
+        Args:
+            tracker (ProgressTracker, optional): The batch to report the job's
+                progress to.
+            progress (TrackProgress, optional): The job's entry in `tracker`,
+                added if not given.
+
+        Returns:
+            tuple[TrackJob, str | None]: The job and the stage to submit it to,
+                or None if it was deduplicated and must not be submitted.
+        """
+        job = TrackJob(track, targets, update_progress, on_done)
+        if tracker:
+            job.tracker = tracker
+            job.progress = progress or tracker.add_track(job.title)
+        with self._progress_lock:
+            job.profile_path, self._profile_path = self._profile_path, None
+        if job.profile_path:
+            job.profiler = cProfile.Profile()
+        # A running job of the same track and targets keeps its entry, this one
+        # is deduplicated against it
+        if not job.track_id or not self._claim_journal_entry(job):
+            return job, "resolve"
+        entry = None
+        if self._take_resumable(job):
+            entry = self.journal.get(job.track_id, targets)
+        if entry and entry["state"] != TAGGED:
+            job.restore(entry["data"])
+            stage = job.resume_stage(entry["state"])
+            logger.info("[%s] Resuming at %s", job.title, stage)
+            if stage != "resolve" and self._deduplicate(job):
+                return job, None
+            return job, stage
+        self.journal.add(job.track_id, track, targets)
+        return job, "resolve"
+
+    def _take_resumable(self, job):
+        """
+        Check whether the journal entry of a job's track was left unfinished by
+        an earlier run and not resumed yet, and mark it as resumed.
+
+        Entries written by this run are not resumed: a duplicate of a track
+        that is still running goes through `_deduplicate` instead.
+        """
+        key = self._journal_key(job)
+        with self._in_flight_lock:
+            if key not in self._resumable:
+                return False
+            self._resumable.remove(key)
+            return True
+
+    def resume_unfinished(
+        self,
+        create_progress_bar,
+        total_update_progress,
+        total_signal_completion,
+    ):
+        """
+        Resume every track left unfinished by an earlier run, into the output
+        targets it was queued with.
+
+        Leftover source and partial files that no unfinished track can reuse
+        are deleted first.
+
+        Args:
+            create_progress_bar (function): Function to create progress bars.
+            total_update_progress (function): Function to update total progress.
+            total_signal_completion (function): Function to signal total completion.
+        """
+        entries = self.journal.unfinished()
+        self.clean_orphans(entries)
+        # Entries of tracks this run queued are being processed already
+        with self._in_flight_lock:
+            resumable = set(self._resumable)
+        self._download_tracks(
+            (
+                (entry["track"], entry["targets"])
+                for entry in entries
+                if (entry["track"]["id"], tuple(entry["targets"])) in resumable
+            ),
+            create_progress_bar,
+            total_update_progress,
+            total_signal_completion,
+            "Resume",
+        )
+
+    def clean_orphans(self, entries=None):
+        """
+        Delete downloaded sources and partial downloads no unfinished track owns.
+
+        Only files named like the fetch stage names them are considered. Files
+        of tracks in a library index, files being fetched, and files changed
+        since the journal's last update, which another run may be writing,
+        are kept.
+
+        Args:
+            entries (list[dict], optional): The unfinished journal entries.
+                Defaults to reading them from the journal.
+
+        Returns:
+            int: The number of deleted files.
+        """
+        if entries is None:
+            entries = self.journal.unfinished()
+        directories = {directory for _, directory in self.get_output_targets()}
+        owned = set()
+        for entry in entries:
+            directories.update(directory for _, directory in entry["targets"])
+            job = TrackJob(entry["track"], entry["targets"])
+            owned.add(
+                os.path.join(job.download_path, self.sanitize_filename(job.title))
+            )
+
+        owned.update(list(self._fetching))
+        # Without any journal update, there is no telling what is leftover
+        last_update = self.journal.last_update() or float("inf")
+
+        removed = 0
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            # A finished track whose title ends in ".source" looks like a source
+            library = get_library_index(directory)
+            finished = {
+                os.path.abspath(os.path.join(library.library_path, path))
+                for path in list(library.tracks.values())
+            }
+            for file in os.scandir(directory):
+                match = SOURCE_FILE_NAME.fullmatch(file.name)
+                if (
+                    not match
+                    or not file.is_file()
+                    or os.path.join(directory, match["name"]) in owned
+                    or os.path.abspath(file.path) in finished
+                    or file.stat().st_mtime >= last_update
+                ):
+                    continue
+                os.remove(file.path)
+                removed += 1
+        if removed:
+            logger.info("Removed %d leftover files", removed)
+        return removed
+
+    def _track_done_callback(self, signal_completion, track_completed):
+        """
+        Create the callback run when a track leaves the pipeline.
 
         Args:
-            track_url (str): The Spotify URL of the track.
-            update_progress (function): Function to update progress.
             signal_completion (function): Function to signal per-track completion.
             track_completed (function): Function to signal total playlist progress.
         """
-        try:
-            self.download_track(track_url, update_progress)
-        except Exception as e:
-            print(f"Error downloading track: {e}")
-        finally:
+
+        def on_done(job):
+            if job.error:
+                logger.error("Error downloading track: %s", job.error)
+            self._job_done(job)
             signal_completion()
             track_completed()
 
+        return on_done
+
+    def _job_done(self, job):
+        """
+        Record the outcome of a track that left the pipeline and tell the
+        listeners about it.
+
+        Tracks that failed with an error are added to the failed tracks;
+        unmatched tracks are not, retrying them would find the same videos.
+        """
+        if job.error and not isinstance(job.error, NoMatchError):
+            with self._unmatched_lock:
+                self.failed_tracks.append(job.track)
+        if job.tracker:
+            job.tracker.finish(job.progress, job.error)
+        if job.followers is not None:
+            self._release_followers(job)
+        self._release_journal_entry(job)
+        if job.error is None:
+            outcome = "completed"
+        elif isinstance(job.error, NoMatchError):
+            outcome = "unmatched"
+        else:
+            outcome = "failed"
+        self.metrics.increment("tracks_total", outcome=outcome)
+        if job.profiler:
+            job.profiler.dump_stats(job.profile_path)
+            logger.info("[%s] Profile written to %s", job.title, job.profile_path)
+        for listener in self.track_done_listeners:
+            listener(job)
+
     def shutdown_executor(self):
         """
-        Shutdown the thread pool executor gracefully.
+        Shutdown the thread pool executor and the pipeline gracefully.
         """
         self.executor.shutdown(wait=True)
+        self.pipeline.shutdown()
+        self.metrics.remove_collector(self.pipeline.collect_metrics)
+        self.metrics.remove_collector(self._collect_metrics)
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        with self._youtube_dl_lock:
+            for ydl in self._youtube_dl_instances:
+                ydl.close()
+            self._youtube_dl_instances.clear()
+        for library in get_loaded_indexes():
+            library.save()
 
     def download_track_async(self, track_url, update_progress, signal_completion):
         """
@@ -207,7 +1512,7 @@ class Downloader:
             try:
                 self.download_track(track_url, update_progress)
             except Exception as e:
-                print(f"Error downloading track: {e}")
+                logger.error("Error downloading track: %s", e)
             finally:
                 signal_completion()
 
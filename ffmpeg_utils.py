@@ -1,43 +1,312 @@
+from functools import lru_cache
+import hashlib
+import logging
 import os
+import shutil
 import zipfile
 import subprocess
 
-import requests
+FFMPEG_URL = (
+    "https://github.com/yt-dlp/FFmpeg-Builds/releases/download/latest/"
+    "ffmpeg-master-latest-win64-gpl.zip"
+)
+FFMPEG_CHECKSUM_URL = (
+    "https://github.com/yt-dlp/FFmpeg-Builds/releases/download/latest/"
+    "checksums.sha256"
+)
+# Only the executables are extracted from the archive, not the docs and DLLs.
+# yt-dlp's fixup postprocessors need FFprobe next to FFmpeg.
+FFMPEG_EXECUTABLES = ("ffmpeg.exe", "ffmpeg", "ffprobe.exe", "ffprobe")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
 
 
 def get_ffmpeg_path():
     return "./ffmpeg/bin"
 
 
+@lru_cache(maxsize=None)
+def get_ffmpeg_executable():
+    """
+    Locate FFmpeg: the bundled copy if it was downloaded, otherwise the one on
+    the PATH. The lookup is cached until `download_ffmpeg` changes the answer.
+
+    Returns:
+        str | None: The path to the executable, or None if there is none.
+    """
+    executable = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
+    bundled = os.path.join(get_ffmpeg_path(), executable)
+    if os.path.exists(bundled):
+        return bundled
+    return shutil.which("ffmpeg")
+
+
 def does_ffmpeg_exist():
-    return os.path.exists(get_ffmpeg_path())
+    return get_ffmpeg_executable() is not None
 
 
-def download_ffmpeg():
-    print("Downloading FFmpeg...")
-    response = requests.get(
-        "https://github.com/yt-dlp/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
-    )
-    if response.status_code != 200:
-        raise Exception("Failed to download FFmpeg")
+def _clear_ffmpeg_caches():
+    get_ffmpeg_executable.cache_clear()
+    get_ffmpeg_version.cache_clear()
+    get_ffmpeg_encoders.cache_clear()
+
+
+def download_ffmpeg(
+    url=FFMPEG_URL, checksum_url=FFMPEG_CHECKSUM_URL, update_progress=None
+):
+    """
+    Download the FFmpeg build and extract only its executables.
+
+    The archive is streamed to disk in chunks and hashed on the way. An
+    interrupted transfer leaves a ".part" file that the next call resumes
+    with a range request. The archive is checked against the SHA-256 listed
+    in the checksum file before anything is extracted.
+
+    Args:
+        url (str, optional): The URL of the zip archive, e.g. a local server
+            standing in for the release when testing offline.
+        checksum_url (str | None, optional): The URL of a "sha256sum" style
+            file listing the archive. None skips the check.
+        update_progress (function, optional): Called with the downloaded and
+            total bytes; the total is None when the server does not send it.
+            Defaults to logging the percentage.
+
+    Raises:
+        Exception: If the download fails or the archive does not match its
+            checksum.
+    """
+    # Only needed on the first run, not worth importing at startup
+    import requests
+
+    archive_name = url.rsplit("/", 1)[-1]
+    archive_path = "ffmpeg.zip"
+    part_path = archive_path + ".part"
+    update_progress = update_progress or _log_download_progress
 
-    with open("ffmpeg.zip", "wb") as f:
-        f.write(response.content)
+    expected_sha256 = None
+    if checksum_url:
+        response = requests.get(checksum_url, timeout=30)
+        response.raise_for_status()
+        expected_sha256 = _find_checksum(response.text, archive_name)
 
-    print("Extracting FFmpeg...")
-    # Remove the prefix from the filename, effectively extracting the contents without the root directory
-    prefix = "ffmpeg-master-latest-win64-gpl/"
-    with zipfile.ZipFile("ffmpeg.zip", "r") as zip_ref:
-        for file in zip_ref.infolist():
-            file.filename = file.filename.replace(prefix, "")
-            if file.filename:
-                zip_ref.extract(file, "ffmpeg")
+    logger.info("Downloading FFmpeg...")
+    sha256 = hashlib.sha256()
+    downloaded = 0
+    if os.path.exists(part_path):
+        # Hash what is already there, the transfer continues from its end
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                downloaded += len(chunk)
 
-    print("Removing FFmpeg zip file...")
-    os.remove("ffmpeg.zip")
+    headers = {"Range": f"bytes={downloaded}-"} if downloaded else {}
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 416:
+            # The part file already holds the whole archive
+            total = downloaded
+        else:
+            response.raise_for_status()
+            if response.status_code != 206 and downloaded:
+                logger.warning("The server does not support resuming, starting over")
+                sha256 = hashlib.sha256()
+                downloaded = 0
+            length = response.headers.get("Content-Length")
+            total = downloaded + int(length) if length else None
+            with open(part_path, "ab" if downloaded else "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    downloaded += len(chunk)
+                    update_progress(downloaded, total)
 
-    print("FFmpeg downloaded and extracted successfully")
+    if expected_sha256 and sha256.hexdigest() != expected_sha256:
+        os.remove(part_path)
+        raise Exception(
+            f"FFmpeg download is corrupt: expected SHA-256 {expected_sha256}, "
+            f"got {sha256.hexdigest()}"
+        )
+    os.replace(part_path, archive_path)
 
+    logger.info("Extracting FFmpeg...")
+    _extract_ffmpeg(archive_path)
 
+    logger.info("Removing FFmpeg zip file...")
+    os.remove(archive_path)
+
+    _clear_ffmpeg_caches()
+    logger.info("FFmpeg downloaded and extracted successfully")
+
+
+def _find_checksum(checksums, file_name):
+    """Return the SHA-256 listed for a file in "<digest>  <name>" lines."""
+    for line in checksums.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[1].lstrip("*") == file_name:
+            return fields[0].lower()
+    raise Exception(f"No checksum listed for {file_name}")
+
+
+def _log_download_progress(downloaded, total):
+    # Log every 10 MB, and with a percentage when the size is known
+    previous = downloaded - DOWNLOAD_CHUNK_SIZE
+    if downloaded // (10 * 1024 * 1024) == max(previous, 0) // (10 * 1024 * 1024):
+        if downloaded != total:
+            return
+    if total:
+        logger.info("Downloaded %.0f%% of FFmpeg", downloaded / total * 100)
+    else:
+        logger.info("Downloaded %d MB of FFmpeg", downloaded // (1024 * 1024))
+
+
+def _extract_ffmpeg(archive_path):
+    """Extract the FFmpeg executables from the archive's bin directory."""
+    os.makedirs(get_ffmpeg_path(), exist_ok=True)
+    extracted = 0
+    with zipfile.ZipFile(archive_path, "r") as archive:
+        for member in archive.infolist():
+            directory, _, name = member.filename.rpartition("/")
+            if not directory.endswith("bin") or name not in FFMPEG_EXECUTABLES:
+                continue
+            target = os.path.join(get_ffmpeg_path(), name)
+            with archive.open(member) as source, open(target, "wb") as f:
+                shutil.copyfileobj(source, f, DOWNLOAD_CHUNK_SIZE)
+            if os.name != "nt":
+                os.chmod(target, 0o755)
+            extracted += 1
+    if not extracted:
+        raise Exception("The FFmpeg archive contains no executable")
+
+
+@lru_cache(maxsize=None)
 def get_ffmpeg_version():
-    return subprocess.check_output([get_ffmpeg_path() + "/ffmpeg.exe", "-version"])
+    return subprocess.check_output([get_ffmpeg_executable(), "-version"])
+
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_encoders():
+    """
+    Probe the audio encoders FFmpeg was built with, once per process.
+
+    Returns:
+        frozenset[str]: The encoder names, e.g. "libmp3lame" and "libopus".
+    """
+    output = subprocess.check_output(
+        [get_ffmpeg_executable(), "-hide_banner", "-encoders"], text=True
+    )
+    # The encoder list follows a legend that ends with a " ------" line, each
+    # entry looks like " A....D libopus   libopus Opus"
+    _, _, listing = output.partition("------")
+    encoders = set()
+    for line in listing.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[0].startswith("A"):
+            encoders.add(fields[1])
+    return frozenset(encoders)
+
+
+# Supported output formats, by file extension. `source_format` is the yt-dlp
+# format selector used to download the source; sources already encoded with
+# one of the `native_codecs` are remuxed instead of re-encoded.
+OUTPUT_FORMATS = {
+    "mp3": {
+        "source_format": "bestaudio/best",
+        "codec": "libmp3lame",
+        "bitrate": "192k",
+        "native_codecs": (),
+    },
+    "opus": {
+        "source_format": "bestaudio[acodec=opus]/bestaudio/best",
+        "codec": "libopus",
+        "bitrate": "160k",
+        "native_codecs": ("opus",),
+    },
+    "m4a": {
+        "source_format": "bestaudio[acodec^=mp4a]/bestaudio/best",
+        "codec": "aac",
+        "bitrate": "192k",
+        "native_codecs": ("mp4a", "aac"),
+    },
+}
+
+
+def transcode_audio(source_path, output_path, codec="libmp3lame", bitrate="192k"):
+    """
+    Encode the audio stream of a file with FFmpeg.
+
+    Args:
+        source_path (str): The downloaded source file.
+        output_path (str): The file to write; its extension selects the container.
+        codec (str, optional): The FFmpeg audio encoder, or "copy" to remux the
+            stream without re-encoding it.
+        bitrate (str, optional): The target audio bitrate, unused when copying.
+    """
+    transcode_audio_outputs(source_path, [(output_path, codec, bitrate)])
+
+
+def transcode_audio_outputs(source_path, outputs):
+    """
+    Encode the audio stream of a file to several outputs in one FFmpeg run.
+
+    The source is read and decoded once, and the decoded audio is fed to every
+    encoder. FFmpeg runs as a child process, so the encoding happens outside
+    the Python process and does not hold the GIL.
+
+    Args:
+        source_path (str): The downloaded source file.
+        outputs (list[tuple[str, str, str]]): The output path, FFmpeg audio
+            encoder (or "copy") and bitrate of every output.
+    """
+    command = [get_ffmpeg_executable(), "-y", "-loglevel", "error", "-i", source_path]
+    for output_path, codec, bitrate in outputs:
+        quality = [] if codec == "copy" else ["-b:a", bitrate]
+        command += ["-map", "0:a:0", "-codec:a", codec, *quality, output_path]
+
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(
+            f"FFmpeg failed to transcode '{source_path}': "
+            f"{result.stderr.decode(errors='replace').strip()}"
+        )
+
+
+def convert_audio(source_path, output_path, output_format, source_codec=None):
+    """
+    Convert a downloaded source to an output format, re-encoding only if needed.
+
+    Args:
+        source_path (str): The downloaded source file.
+        output_path (str): The file to write.
+        output_format (str): A key of OUTPUT_FORMATS.
+        source_codec (str, optional): The codec of the source, as reported by
+            yt-dlp (e.g. "opus" or "mp4a.40.2").
+    """
+    convert_audio_outputs(source_path, [(output_path, output_format)], source_codec)
+
+
+def convert_audio_outputs(source_path, outputs, source_codec=None):
+    """
+    Convert a downloaded source to several output formats at once.
+
+    Outputs in the source's own codec are remuxed, the others are encoded from
+    a single decode of the source.
+
+    Args:
+        source_path (str): The downloaded source file.
+        outputs (list[tuple[str, str]]): The path and OUTPUT_FORMATS key of
+            every output.
+        source_codec (str, optional): The codec of the source, as reported by
+            yt-dlp (e.g. "opus" or "mp4a.40.2").
+    """
+    encoders = []
+    for output_path, output_format in outputs:
+        settings = OUTPUT_FORMATS[output_format]
+        if source_codec and source_codec.startswith(settings["native_codecs"]):
+            encoders.append((output_path, "copy", None))
+        elif settings["codec"] not in get_ffmpeg_encoders():
+            raise Exception(
+                f"FFmpeg has no {settings['codec']} encoder for {output_format}"
+            )
+        else:
+            encoders.append((output_path, settings["codec"], settings["bitrate"]))
+    transcode_audio_outputs(source_path, encoders)
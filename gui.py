@@ -1,22 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
 import os
+import queue
+import re
+import threading
 
-from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import ttk, filedialog
 
 from config import Config
-from downloader import Downloader
+from progress import combine_snapshots, describe_snapshot
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_PATH = "imgs/background.jpg"
+# The background resized to the window, as PNG so Tk can load it without
+# Pillow. Stored next to the metadata cache, one file for the current size.
+BACKGROUND_CACHE_NAME = "background_{width}x{height}.png"
+BACKGROUND_CACHE_PATTERN = re.compile(r"background_\d+x\d+\.png")
+
+
+def load_background(width, height):
+    """
+    Load the background image resized to the window.
+
+    The resized image is cached on disk, so Pillow is only imported and the
+    JPEG only decoded when the cache is missing or older than the source.
+
+    Returns:
+        tk.PhotoImage: The resized background.
+    """
+    cache_dir = os.path.dirname(Config().cache_path) or "."
+    cache_name = BACKGROUND_CACHE_NAME.format(width=width, height=height)
+    cache_path = os.path.join(cache_dir, cache_name)
+    if not os.path.exists(cache_path) or os.path.getmtime(
+        cache_path
+    ) < os.path.getmtime(BACKGROUND_PATH):
+        from PIL import Image
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with Image.open(BACKGROUND_PATH) as image:
+            image.resize((width, height)).save(cache_path)
+        # Backgrounds rendered for other window sizes are not needed anymore
+        for file in os.scandir(cache_dir):
+            if file.name != cache_name and BACKGROUND_CACHE_PATTERN.fullmatch(
+                file.name
+            ):
+                os.remove(file.path)
+    return tk.PhotoImage(file=cache_path)
 
 
 class MusicDownloaderGUI:
+    # Worker threads only queue progress events, the main thread applies them
+    # on a timer, so thousands of tracks cannot flood the Tk event loop
+    PROGRESS_TICK_MS = 100
+    # Progress rows that exist as widgets; the rows are reused while scrolling
+    PROGRESS_ROWS = 8
+    # Shortest query searched while typing, shorter ones match too much
+    MIN_TYPEAHEAD_LENGTH = 3
+
     def __init__(self, root: tk.Tk):
         # Root Settings
         self.config: Config = Config()
         self.root: tk.Tk = root
         self.root.title("Music Downloader")
 
-        # Initialize the list to track progress bars
-        self.active_progress_bars: list[tk.Frame] = []
+        # Progress of every download, updated from worker threads through the
+        # event queue; only the visible rows are drawn
+        self.progress_events: queue.SimpleQueue = queue.SimpleQueue()
+        self.progress_rows: list[dict] = []
+        self.progress_rows_by_id: dict[int, dict] = {}
+        self.progress_offset: int = 0
+        self._progress_ids = itertools.count()
+        # Set by the downloader's progress listener, the next tick redraws
+        self._progress_changed: bool = False
+
+        # Searches run one at a time off the UI thread; a newer query makes the
+        # older ones skip their request or drop their results
+        self._search_executor = ThreadPoolExecutor(max_workers=1)
+        self._search_generation = itertools.count(1)
+        self._latest_search = 0
+        self._search_after_id: str | None = None
 
         # Fixed window size
         self.window_width: int = 1000
@@ -29,10 +94,9 @@ class MusicDownloaderGUI:
         self.root.wait_visibility()
         self.root.resizable(False, False)
 
-        # Load and resize the background image
-        self.background_image: Image.Image = Image.open("imgs/background.jpg")
-        self.bg_image_resized: ImageTk.PhotoImage = ImageTk.PhotoImage(
-            self.background_image.resize((self.window_width, self.window_height))
+        # Load the background image, resized to the window
+        self.bg_image_resized: tk.PhotoImage = load_background(
+            self.window_width, self.window_height
         )
 
         # Create canvas and add background image
@@ -42,8 +106,9 @@ class MusicDownloaderGUI:
         self.canvas.pack(fill="both", expand=True)
         self.canvas.create_image(0, 0, image=self.bg_image_resized, anchor="nw")
 
-        # Downloader instance
-        self.downloader: Downloader | None = None
+        # Downloader instance, created in the background by start_downloader
+        self.downloader = None
+        self._downloader_thread: threading.Thread | None = None
 
         # Set up the UI
         self.setup_ui()
@@ -53,18 +118,44 @@ class MusicDownloaderGUI:
         if not self.config.spotify_client_id or not self.config.spotify_client_secret:
             self.open_popup()
         else:
+            self.start_downloader()
+
+    def start_downloader(self):
+        """
+        Create the Downloader on a background thread.
+
+        Importing spotipy and requests and opening the caches takes
+        longer than building the window, so the window is usable before the
+        Downloader is ready; actions that need it wait for it.
+        """
+
+        def create():
+            from downloader import Downloader
+
             self.downloader = Downloader(self.config.download_path)
+            self.downloader.progress_listeners.append(self.on_progress_changed)
+            self.call_soon(self.resume_downloads)
+
+        self._downloader_thread = threading.Thread(target=create, daemon=True)
+        self._downloader_thread.start()
+
+    def get_downloader(self):
+        """Return the Downloader, waiting if it is still being created."""
+        if self._downloader_thread:
+            self._downloader_thread.join()
+        return self.downloader
 
     def quit(self):
         self.config.save()
-        if self.downloader:
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
+        if self.get_downloader():
             self.downloader.shutdown_executor()  # Ensure all tasks are completed
         self.root.quit()
 
     def setup_ui(self):
         """Set up the main UI components."""
         if not self.config.download_path:
-            print("Download path is not set!")
+            logger.error("Download path is not set!")
             return
         os.makedirs(self.config.download_path, exist_ok=True)
 
@@ -97,6 +188,76 @@ class MusicDownloaderGUI:
         )
         download_button.place(x=100, y=240)
 
+        # Sync mode: only download the tracks missing from the download path
+        self.sync_mode: tk.BooleanVar = tk.BooleanVar(value=False)
+        sync_checkbox: tk.Checkbutton = tk.Checkbutton(
+            self.canvas,
+            text="Sync playlist (only new tracks)",
+            variable=self.sync_mode,
+            fg="white",
+            bg="#3c3c3c",
+            selectcolor="#3c3c3c",  # Keep the check box readable on the dark theme
+            activebackground="#3c3c3c",
+            activeforeground="white",
+            font=("Arial", 10),
+        )
+        sync_checkbox.place(x=200, y=243)
+
+        # Number of parallel downloads, applied immediately to running downloads
+        workers_label: tk.Label = tk.Label(
+            self.canvas,
+            text="Workers",
+            fg="white",
+            bg="#3c3c3c",
+            font=("Arial", 10),
+        )
+        workers_label.place(x=430, y=245)
+        self.workers_value: tk.StringVar = tk.StringVar(
+            value=str(self.config.max_thread_workers)
+        )
+        workers_spinbox: tk.Spinbox = tk.Spinbox(
+            self.canvas,
+            from_=1,
+            to=64,
+            width=4,
+            textvariable=self.workers_value,
+            command=self.set_max_workers,
+            bg="#3c3c3c",
+            fg="white",
+            buttonbackground="#3c3c3c",
+            insertbackground="white",
+        )
+        workers_spinbox.place(x=490, y=245)
+
+        # Total download speed of all workers in KB/s (0 = unlimited), applied
+        # immediately to running downloads
+        bandwidth_label: tk.Label = tk.Label(
+            self.canvas,
+            text="Limit KB/s",
+            fg="white",
+            bg="#3c3c3c",
+            font=("Arial", 10),
+        )
+        bandwidth_label.place(x=550, y=245)
+        self.bandwidth_value: tk.StringVar = tk.StringVar(
+            value=str(self.config.bandwidth_limit // 1024)
+        )
+        bandwidth_spinbox: tk.Spinbox = tk.Spinbox(
+            self.canvas,
+            from_=0,
+            to=1024 * 1024,
+            increment=256,
+            width=7,
+            textvariable=self.bandwidth_value,
+            command=self.set_bandwidth_limit,
+            bg="#3c3c3c",
+            fg="white",
+            buttonbackground="#3c3c3c",
+            insertbackground="white",
+        )
+        bandwidth_spinbox.bind("<Return>", lambda event: self.set_bandwidth_limit())
+        bandwidth_spinbox.place(x=630, y=245)
+
         # Add the entry field with the default path
         self.download_path_entry: tk.Entry = self.create_entry(x=100, y=200)
         # Set the default value
@@ -115,6 +276,39 @@ class MusicDownloaderGUI:
         )
         select_path.place(x=100, y=155)
 
+        # Download every track that failed with an error again
+        retry_button: tk.Button = tk.Button(
+            self.canvas,
+            text="Retry failed",
+            fg="white",
+            bg="#FF9800",  # Orange background for 'Retry failed'
+            font=("Arial", 10, "bold"),
+            padx=10,
+            pady=5,
+            command=self.retry_failed,
+        )
+        retry_button.place(x=220, y=155)
+
+        # Download each playlist into its own folder, linking shared tracks
+        self.playlist_folders: tk.BooleanVar = tk.BooleanVar(
+            value=self.config.playlist_folders
+        )
+        playlist_folders_checkbox: tk.Checkbutton = tk.Checkbutton(
+            self.canvas,
+            text="Folder per playlist",
+            variable=self.playlist_folders,
+            command=lambda: setattr(
+                self.config, "playlist_folders", self.playlist_folders.get()
+            ),
+            fg="white",
+            bg="#3c3c3c",
+            selectcolor="#3c3c3c",
+            activebackground="#3c3c3c",
+            activeforeground="white",
+            font=("Arial", 10),
+        )
+        playlist_folders_checkbox.place(x=330, y=158)
+
         # Search Section
         self.create_section_label("Search songs on Spotify", x=100, y=300)
         self.search_entry: tk.Entry = self.create_entry(x=100, y=340)
@@ -131,6 +325,28 @@ class MusicDownloaderGUI:
             command=self.search_songs,
         )
         search_button.place(x=100, y=380)
+        self.search_entry.bind("<Return>", lambda event: self.search_songs())
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
+
+        # Search as you type, debounced so only pauses in typing hit Spotify
+        self.search_as_you_type: tk.BooleanVar = tk.BooleanVar(
+            value=self.config.search_as_you_type
+        )
+        search_as_you_type_checkbox: tk.Checkbutton = tk.Checkbutton(
+            self.canvas,
+            text="Search as you type",
+            variable=self.search_as_you_type,
+            command=lambda: setattr(
+                self.config, "search_as_you_type", self.search_as_you_type.get()
+            ),
+            fg="white",
+            bg="#3c3c3c",
+            selectcolor="#3c3c3c",
+            activebackground="#3c3c3c",
+            activeforeground="white",
+            font=("Arial", 10),
+        )
+        search_as_you_type_checkbox.place(x=190, y=383)
 
         # Results Section: Create a canvas with a scrollbar
         self.results_canvas: tk.Canvas = tk.Canvas(
@@ -156,8 +372,44 @@ class MusicDownloaderGUI:
 
         # Download Progress Section
         self.create_section_label("Download Progress", x=600, y=80)
+        # Throughput and estimated completion of all running downloads
+        self.progress_summary: tk.Label = tk.Label(
+            self.canvas, fg="white", bg="#3c3c3c", font=("Arial", 10)
+        )
+        self.progress_summary.place(x=780, y=86)
         self.download_bars_frame: tk.Frame = tk.Frame(self.canvas, bg="#3c3c3c")
         self.download_bars_frame.place(x=600, y=120)
+        self.progress_scrollbar: tk.Scrollbar = tk.Scrollbar(
+            self.canvas, orient="vertical", command=self.scroll_progress
+        )
+        self.progress_scrollbar.place(x=960, y=120, height=300)
+        self.progress_widgets: list[tuple[tk.Label, ttk.Progressbar]] = []
+        for row in range(self.PROGRESS_ROWS):
+            # Two lines: the title, and the stage, speed and ETA of the track
+            label: tk.Label = tk.Label(
+                self.download_bars_frame,
+                anchor="w",
+                justify="left",
+                width=32,
+                fg="white",
+                bg="#3c3c3c",
+                font=("Arial", 9),
+            )
+            label.grid(row=row, column=0, sticky="w", pady=2)
+            progress_bar: ttk.Progressbar = ttk.Progressbar(
+                self.download_bars_frame,
+                orient="horizontal",
+                mode="determinate",
+                length=120,
+            )
+            progress_bar.grid(row=row, column=1, padx=5)
+            progress_bar.grid_remove()
+            for widget in (label, progress_bar):
+                # Windows and macOS send MouseWheel, X11 sends buttons 4 and 5
+                for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                    widget.bind(sequence, self.on_progress_mousewheel)
+            self.progress_widgets.append((label, progress_bar))
+        self.root.after(self.PROGRESS_TICK_MS, self.process_progress_events)
 
     def open_popup(self):
         top: tk.Toplevel = tk.Toplevel(self.root)
@@ -299,8 +551,8 @@ class MusicDownloaderGUI:
             if self.client_id_entry.get() and self.client_secret_entry.get():
                 self.config.spotify_client_id = self.client_id_entry.get()
                 self.config.spotify_client_secret = self.client_secret_entry.get()
-                self.downloader = Downloader(self.config.download_path)
                 top.destroy()
+                self.start_downloader()
 
         top.protocol("WM_DELETE_WINDOW", close_app)
 
@@ -345,6 +597,7 @@ class MusicDownloaderGUI:
             pady=5,
         )
         label.place(x=x, y=y)
+        return label
 
     def create_entry(self, x, y):
         """Creates a styled entry field."""
@@ -359,6 +612,28 @@ class MusicDownloaderGUI:
         entry.place(x=x, y=y)
         return entry
 
+    def set_max_workers(self):
+        """Apply the number of workers from the spinbox."""
+        try:
+            workers: int = int(self.workers_value.get())
+        except ValueError:
+            return
+        if self.downloader:
+            self.downloader.set_max_workers(workers)
+        else:
+            self.config.max_thread_workers = workers
+
+    def set_bandwidth_limit(self):
+        """Apply the download speed limit from the spinbox."""
+        try:
+            rate: int = int(self.bandwidth_value.get()) * 1024
+        except ValueError:
+            return
+        if self.downloader:
+            self.downloader.set_bandwidth_limit(rate)
+        else:
+            self.config.bandwidth_limit = rate
+
     def select_path(self):
         """Opens a directory selection dialog and updates the path."""
         folder_path: str = filedialog.askdirectory()
@@ -371,6 +646,8 @@ class MusicDownloaderGUI:
 
     def start_download(self):
         """Start downloading the song or playlist."""
+        if not self.get_downloader():
+            return
         url: str = self.entry_url.get()
         download_path: str = self.download_path_entry.get()
         if not download_path:
@@ -381,18 +658,42 @@ class MusicDownloaderGUI:
             os.makedirs(download_path)
         self.downloader.download_path = download_path
 
-        if "playlist" in url:
+        track_urls: list[str] = url.split()
+        if len(track_urls) > 1:
             total_update_progress, total_signal_completion = self.create_progress_bar(
-                "Playlist Download"
+                "Tracks Download"
             )
-            # Submit playlist download to the executor
+            # Submit the batch of tracks to the executor
             self.downloader.executor.submit(
-                self.downloader.download_playlist,
-                url,
+                self.downloader.download_tracks,
+                track_urls,
                 self.create_progress_bar,
                 total_update_progress,
                 total_signal_completion,
             )
+        elif "playlist" in url:
+            total_update_progress, total_signal_completion = self.create_progress_bar(
+                "Playlist Download"
+            )
+            if self.sync_mode.get():
+                # Submit playlist sync to the executor
+                self.downloader.executor.submit(
+                    self.downloader.sync_playlist,
+                    url,
+                    self.create_progress_bar,
+                    total_update_progress,
+                    total_signal_completion,
+                    self.config.sync_prune,
+                )
+            else:
+                # Submit playlist download to the executor
+                self.downloader.executor.submit(
+                    self.downloader.download_playlist,
+                    url,
+                    self.create_progress_bar,
+                    total_update_progress,
+                    total_signal_completion,
+                )
         else:
             track_update_progress, track_signal_completion = self.create_progress_bar(
                 "Track Download"
@@ -402,10 +703,72 @@ class MusicDownloaderGUI:
                 self.downloader.download_track, url, track_update_progress
             )
 
+    def resume_downloads(self):
+        """Resume the downloads an earlier run left unfinished."""
+        if not self.downloader.journal.unfinished():
+            return
+        total_update_progress, total_signal_completion = self.create_progress_bar(
+            "Resume Downloads"
+        )
+        self.downloader.executor.submit(
+            self.downloader.resume_unfinished,
+            self.create_progress_bar,
+            total_update_progress,
+            total_signal_completion,
+        )
+
+    def retry_failed(self):
+        """Retry the tracks that failed with an error."""
+        if not self.get_downloader() or not self.downloader.failed_tracks:
+            logger.info("No failed tracks to retry")
+            return
+        total_update_progress, total_signal_completion = self.create_progress_bar(
+            "Retry Failed"
+        )
+        self.downloader.executor.submit(
+            self.downloader.retry_failed,
+            self.create_progress_bar,
+            total_update_progress,
+            total_signal_completion,
+        )
+
+    def on_search_key(self, event):
+        """Schedule a search once typing pauses, in search-as-you-type mode."""
+        if not self.search_as_you_type.get() or event.keysym == "Return":
+            return
+        if self._search_after_id:
+            self.root.after_cancel(self._search_after_id)
+            self._search_after_id = None
+        if len(self.search_entry.get().strip()) >= self.MIN_TYPEAHEAD_LENGTH:
+            self._search_after_id = self.root.after(
+                self.config.search_debounce_ms, self.search_songs
+            )
+
     def search_songs(self):
-        """Search for songs on Spotify."""
-        query = self.search_entry.get()
-        results = self.downloader.search_tracks(query)
+        """Search for songs on Spotify in the background."""
+        self._search_after_id = None
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        generation = self._latest_search = next(self._search_generation)
+
+        def search():
+            # Skip queries replaced while waiting for the previous search
+            if generation != self._latest_search or not self.get_downloader():
+                return
+            try:
+                results = self.downloader.search_tracks(query)
+            except Exception as e:
+                logger.error("Search failed: %s", e)
+                return
+            self.call_soon(lambda: self.show_search_results(generation, results))
+
+        self._search_executor.submit(search)
+
+    def show_search_results(self, generation, results):
+        """Replace the result rows, unless a newer search has started since."""
+        if generation != self._latest_search:
+            return
 
         # Clear previous search results
         for widget in self.results_scrollable_frame.winfo_children():
@@ -415,8 +778,10 @@ class MusicDownloaderGUI:
         for track in results:
             self.create_result_row(track)
 
-        # Update the scroll region to fit the content
+        # Lay out all rows in one pass, then fit the scroll region to them
+        self.results_scrollable_frame.update_idletasks()
         self.results_canvas.configure(scrollregion=self.results_canvas.bbox("all"))
+        self.results_canvas.yview_moveto(0)
 
     def on_results_canvas_configure(self, event):
         """Update the scroll region of the canvas to match the content size."""
@@ -465,66 +830,129 @@ class MusicDownloaderGUI:
     def make_rounded(self, widget):
         """Apply rounded corners effect to a widget."""
         widget.config(highlightbackground="black", highlightcolor="black", bd=0)
-        widget.update_idletasks()
 
     def set_download_url(self, url):
         """Set the selected song's URL into the entry field."""
         self.entry_url.delete(0, tk.END)
         self.entry_url.insert(0, url)
 
-    def create_progress_bar(self, title):
-        """Create and manage a download progress bar."""
-        frame: tk.Frame = tk.Frame(self.download_bars_frame, bg=None)
-        frame.pack(fill="x", pady=5)
+    def create_progress_bar(self, title, progress=None):
+        """
+        Add a progress row; safe to call from any thread.
 
-        label: tk.Label = tk.Label(
-            frame, text=title, anchor="w", fg="white", bg="#3c3c3c"
-        )
-        label.pack(side="left")
-
-        progress_bar: ttk.Progressbar = ttk.Progressbar(
-            frame, orient="horizontal", mode="determinate", length=200
-        )
-        progress_bar.pack(side="left", padx=5)
+        Args:
+            title (str): The title of the row.
+            progress (TrackProgress, optional): The track's progress model,
+                read when the row is drawn to show its stage, speed and ETA.
 
-        # Store references for cleanup
-        self.active_progress_bars.append(frame)  # Ensure this list exists in __init__
+        Returns:
+            tuple[function, function]: Functions to update the progress with the
+                current and total steps, and to mark the download completed.
+        """
+        row_id = next(self._progress_ids)
+        self.progress_events.put(("create", row_id, title, progress))
 
         def update_progress(current, total):
-            if progress_bar.winfo_exists():
-                self.root.after(
-                    0, lambda: self._update_progress_bar(progress_bar, current, total)
-                )
+            self.progress_events.put(("update", row_id, current, total))
 
         def signal_completion():
-            if frame.winfo_exists():
-                self.root.after(
-                    0,
-                    lambda: self._signal_completion(frame, label, progress_bar, title),
-                )
+            self.progress_events.put(("complete", row_id))
 
         return update_progress, signal_completion
 
-    def _update_progress_bar(self, progress_bar, current, total):
-        """Update the progress bar safely."""
-        # Check if the widget exists
-        if progress_bar.winfo_exists():
-            progress_bar["maximum"] = total
-            progress_bar["value"] = current
-
-    def _signal_completion(self, frame, label, progress_bar, title):
-        """Signal the completion of a download safely."""
-        if frame.winfo_exists():  # Check if the frame still exists
-            frame.config(bg="#3c3c3c")  # Match the background of other UI components
-            label.config(fg="green", text=f"{title} - Completed")
-        if progress_bar.winfo_exists():  # Check if the progress bar exists
-            progress_bar.destroy()
-
-    def cleanup_widgets(self, frame):
-        """Clean up a widget safely."""
-        # Cancel all associated callbacks
-        self.root.after_cancel(self.root)  # Cancel callbacks if you store references
-
-        # Destroy the frame
-        if frame.winfo_exists():
-            frame.destroy()
+    def call_soon(self, callback):
+        """Run a callback on the main thread at the next tick, from any thread."""
+        self.progress_events.put(("call", callback))
+
+    def on_progress_changed(self, tracker, track):
+        """Progress listener of the downloader, called from worker threads."""
+        self._progress_changed = True
+
+    def process_progress_events(self):
+        """Apply every queued event, then redraw the visible rows once."""
+        self.root.after(self.PROGRESS_TICK_MS, self.process_progress_events)
+        changed, self._progress_changed = self._progress_changed, False
+        while True:
+            try:
+                event = self.progress_events.get_nowait()
+            except queue.Empty:
+                break
+            kind, *args = event
+            if kind == "call":
+                args[0]()
+                continue
+            changed = True
+            if kind == "create":
+                row_id, title, progress = args
+                row = {
+                    "title": title,
+                    "progress": progress,
+                    "current": 0,
+                    "total": 0,
+                    "completed": False,
+                }
+                self.progress_rows.append(row)
+                self.progress_rows_by_id[row_id] = row
+            elif kind == "update":
+                row_id, current, total = args
+                row = self.progress_rows_by_id[row_id]
+                row["current"], row["total"] = current, total
+            elif kind == "complete":
+                self.progress_rows_by_id[args[0]]["completed"] = True
+        if changed:
+            self.render_progress()
+
+    def render_progress(self):
+        """Show the rows from the scroll offset in the reused row widgets."""
+        snapshots = self.downloader.get_progress() if self.downloader else []
+        self.progress_summary.config(
+            text=describe_snapshot(combine_snapshots(snapshots)) if snapshots else ""
+        )
+        count = len(self.progress_rows)
+        self.progress_offset = max(
+            0, min(self.progress_offset, count - self.PROGRESS_ROWS)
+        )
+        visible = self.progress_rows[
+            self.progress_offset : self.progress_offset + self.PROGRESS_ROWS
+        ]
+        for index, (label, progress_bar) in enumerate(self.progress_widgets):
+            if index >= len(visible):
+                label.config(text="")
+                progress_bar.grid_remove()
+                continue
+            row = visible[index]
+            if row["completed"]:
+                label.config(fg="green", text=f"{row['title']} - Completed")
+                progress_bar.grid_remove()
+            else:
+                progress = row["progress"]
+                text, value = row["title"], row["current"]
+                if progress:
+                    text += f"\n{progress.describe()}"
+                    # The fetch stage fills up with the downloaded bytes
+                    if progress.stage == "fetch" and progress.fraction:
+                        value += progress.fraction
+                label.config(fg="white", text=text)
+                progress_bar.config(maximum=max(row["total"], 1), value=value)
+                progress_bar.grid()
+        if count > self.PROGRESS_ROWS:
+            self.progress_scrollbar.set(
+                self.progress_offset / count,
+                (self.progress_offset + self.PROGRESS_ROWS) / count,
+            )
+        else:
+            self.progress_scrollbar.set(0, 1)
+
+    def scroll_progress(self, action, amount, unit=None):
+        """Scrollbar command: move the visible window over the progress rows."""
+        if action == "moveto":
+            self.progress_offset = int(float(amount) * len(self.progress_rows))
+        elif unit == "pages":
+            self.progress_offset += int(amount) * self.PROGRESS_ROWS
+        else:
+            self.progress_offset += int(amount)
+        self.render_progress()
+
+    def on_progress_mousewheel(self, event):
+        up = event.num == 4 or event.delta > 0
+        self.scroll_progress("scroll", -1 if up else 1, "units")
@@ -0,0 +1,28 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the requests session shared by all download workers.
+
+    The connection pool is sized to the number of workers, so every worker can
+    keep a warm connection to the same host.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = max(Config().max_thread_workers, 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
@@ -0,0 +1,162 @@
+import json
+import sqlite3
+import threading
+import time
+
+# The states of a track, in the order of the pipeline stages completing
+PENDING = "pending"
+RESOLVED = "resolved"
+DOWNLOADED = "downloaded"
+TRANSCODED = "transcoded"
+TAGGED = "tagged"
+STATES = (PENDING, RESOLVED, DOWNLOADED, TRANSCODED, TAGGED)
+
+
+class JobJournal:
+    """
+    Persistent record of the pipeline state of every queued track, so a
+    download interrupted by a crash or by closing the app can be resumed.
+
+    Entries are keyed by track and output targets, so the same track queued
+    for different folders or formats has an entry per job. The track object
+    and output targets are written once, when the track is queued; each later
+    state change only rewrites one small row, so the journal can be updated
+    thousands of times a minute.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # Survives the app crashing, only a power loss may drop the last
+            # updates, which are then redone on resume
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " track_id TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " track TEXT NOT NULL,"
+                " targets TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (track_id, targets))"
+            )
+            self._connection.commit()
+
+    def add(self, track_id, track, targets):
+        """
+        Record a track as pending, replacing any earlier state of the same
+        track and targets.
+
+        Args:
+            track_id (str): The Spotify ID of the track.
+            track (dict): The Spotify track object.
+            targets (list[tuple[str, str]]): The output formats and directories.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO jobs"
+                " (track_id, state, track, targets, data, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    track_id,
+                    PENDING,
+                    json.dumps(track),
+                    self._targets_key(targets),
+                    "{}",
+                    time.time(),
+                ),
+            )
+            self._connection.commit()
+
+    def update(self, track_id, targets, state, data):
+        """
+        Record that a track reached a state.
+
+        Args:
+            track_id (str): The Spotify ID of the track.
+            targets (list[tuple[str, str]]): The output targets it was added with.
+            state (str): One of STATES.
+            data (dict): What the completed stages produced, e.g. the video URL
+                and file paths, needed to resume from this state.
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, data = ?, updated_at = ?"
+                " WHERE track_id = ? AND targets = ?",
+                (
+                    state,
+                    json.dumps(data),
+                    time.time(),
+                    track_id,
+                    self._targets_key(targets),
+                ),
+            )
+            self._connection.commit()
+
+    def get(self, track_id, targets):
+        """
+        Return the recorded state of a track queued for some output targets.
+
+        Returns:
+            dict | None: The `state`, `track`, `targets` and `data` of the
+                track, or None if it is not in the journal.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state, track, targets, data FROM jobs"
+                " WHERE track_id = ? AND targets = ?",
+                (track_id, self._targets_key(targets)),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._entry(*row)
+
+    def unfinished(self):
+        """Return the entries of every track that was not tagged yet."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, track, targets, data FROM jobs"
+                " WHERE state != ? ORDER BY updated_at",
+                (TAGGED,),
+            ).fetchall()
+        return [self._entry(*row) for row in rows]
+
+    def last_update(self):
+        """Return the time of the latest change to any entry, or None if empty."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MAX(updated_at) FROM jobs"
+            ).fetchone()
+        return row[0]
+
+    def remove_finished(self):
+        """Drop the tagged tracks, which have nothing left to resume."""
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE state = ?", (TAGGED,))
+            self._connection.commit()
+
+    @staticmethod
+    def _targets_key(targets):
+        # Tuples and lists serialize alike, so the key matches either
+        return json.dumps([list(target) for target in targets])
+
+    @staticmethod
+    def _entry(state, track, targets, data):
+        return {
+            "state": state,
+            "track": json.loads(track),
+            # JSON turns the (format, directory) tuples into lists
+            "targets": [tuple(target) for target in json.loads(targets)],
+            "data": json.loads(data),
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
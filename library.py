@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+
+
+class LibraryIndex:
+    """
+    Index of the tracks already downloaded into a library folder.
+
+    Maps Spotify track IDs to their output files and remembers, for every
+    synced playlist, the snapshot ID and track IDs it had at the last sync.
+    The index is stored as `library.json` inside the library folder, with
+    paths relative to it, so the folder can be moved as a whole.
+    """
+
+    FILE_NAME = "library.json"
+    # Number of changes kept in memory before the index is written to disk
+    SAVE_INTERVAL = 25
+
+    def __init__(self, library_path):
+        """
+        Load the index of a library folder.
+
+        Args:
+            library_path (str): The folder the tracks are downloaded into.
+        """
+        self.library_path = library_path
+        self.index_path = os.path.join(library_path, self.FILE_NAME)
+        self._lock = threading.RLock()
+        self._unsaved_changes = 0
+        self.tracks: dict[str, str] = {}
+        self.playlists: dict[str, dict] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, "r") as f:
+            data: dict = json.load(f)
+        with self._lock:
+            self.tracks = data.get("tracks", {})
+            self.playlists = data.get("playlists", {})
+
+    def save(self):
+        with self._lock:
+            if not self._unsaved_changes:
+                return
+            os.makedirs(self.library_path, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a broken index
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"tracks": self.tracks, "playlists": self.playlists}, f)
+            os.replace(temp_path, self.index_path)
+            self._unsaved_changes = 0
+
+    def _changed(self):
+        self._unsaved_changes += 1
+        if self._unsaved_changes >= self.SAVE_INTERVAL:
+            self.save()
+
+    def get_file(self, track_id):
+        """Return the absolute path of a track's file, or None if it is missing."""
+        with self._lock:
+            relative_path = self.tracks.get(track_id)
+        if relative_path is None:
+            return None
+        file_path = os.path.join(self.library_path, relative_path)
+        return file_path if os.path.exists(file_path) else None
+
+    def has_track(self, track_id):
+        return self.get_file(track_id) is not None
+
+    def add_track(self, track_id, file_path):
+        with self._lock:
+            self.tracks[track_id] = os.path.relpath(file_path, self.library_path)
+            self._changed()
+
+    def remove_track(self, track_id):
+        """Forget a track and delete its file."""
+        file_path = self.get_file(track_id)
+        if file_path:
+            os.remove(file_path)
+        with self._lock:
+            self.tracks.pop(track_id, None)
+            self._changed()
+
+    def get_playlist(self, playlist_id):
+        with self._lock:
+            return self.playlists.get(playlist_id)
+
+    def set_playlist(self, playlist_id, snapshot_id, track_ids, unmatched_ids=()):
+        """
+        Record a completed sync of a playlist.
+
+        Args:
+            playlist_id (str): The Spotify ID of the playlist.
+            snapshot_id (str): The snapshot ID the playlist had.
+            track_ids (list[str]): The IDs of its tracks.
+            unmatched_ids (list[str], optional): The IDs of its tracks without
+                an acceptable video, which are not in the library.
+        """
+        with self._lock:
+            self.playlists[playlist_id] = {
+                "snapshot_id": snapshot_id,
+                "track_ids": list(track_ids),
+                "unmatched_ids": list(unmatched_ids),
+            }
+            self._changed()
+
+    def is_referenced(self, track_id, exclude_playlist_id=None):
+        """Check whether any synced playlist, other than the excluded one, has the track."""
+        with self._lock:
+            return any(
+                track_id in playlist["track_ids"]
+                for playlist_id, playlist in self.playlists.items()
+                if playlist_id != exclude_playlist_id
+            )
+
+
+_indexes: dict[str, LibraryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_library_index(library_path):
+    """Return the shared index of a library folder."""
+    key = os.path.abspath(library_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LibraryIndex(library_path)
+        return _indexes[key]
+
+
+def get_loaded_indexes():
+    """Return every index loaded so far, e.g. to save them all."""
+    with _indexes_lock:
+        return list(_indexes.values())
+
+
+def find_library_indexes(library_path):
+    """Return the indexes of a library folder's subfolders, e.g. playlist folders."""
+    if not os.path.isdir(library_path):
+        return []
+    return [
+        get_library_index(entry.path)
+        for entry in os.scandir(library_path)
+        if entry.is_dir()
+        and os.path.exists(os.path.join(entry.path, LibraryIndex.FILE_NAME))
+    ]
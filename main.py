@@ -1,11 +1,15 @@
+import logging
 import tkinter as tk
 
 from gui import MusicDownloaderGUI
 from ffmpeg_utils import does_ffmpeg_exist, download_ffmpeg
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
     if not does_ffmpeg_exist():
-        print("FFmpeg not found")
+        logging.info("FFmpeg not found")
         download_ffmpeg()
 
     root = tk.Tk()
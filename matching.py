@@ -0,0 +1,103 @@
+import difflib
+import re
+
+# Words that mark a different version of a song, unless the track name has them too
+VERSION_MARKERS = (
+    "live",
+    "remix",
+    "extended",
+    "cover",
+    "karaoke",
+    "instrumental",
+    "acoustic",
+    "sped up",
+    "slowed",
+    "nightcore",
+    "8d",
+    "hour",
+    "loop",
+    "reaction",
+)
+
+
+class NoMatchError(Exception):
+    """Raised when no search result is close enough to the Spotify track."""
+
+
+def normalize(text):
+    """Lowercase a title and reduce it to words, for fuzzy comparison."""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def score_candidate(track, entry, duration_tolerance):
+    """
+    Score how well a flat search result matches a Spotify track.
+
+    Args:
+        track (dict): The Spotify track object.
+        entry (dict): The flat search result (title, channel, duration, ...).
+        duration_tolerance (float): The largest accepted duration difference,
+            in seconds.
+
+    Returns:
+        float | None: The score, higher is better, or None if the candidate is
+            not acceptable.
+    """
+    title = normalize(entry.get("title"))
+    channel = normalize(entry.get("channel") or entry.get("uploader"))
+    description = normalize(entry.get("description"))
+    track_name = normalize(track["name"])
+
+    score = 0.0
+    duration = entry.get("duration")
+    if track.get("duration_ms"):
+        # Live streams and premieres have no duration and are never the track
+        if not duration:
+            return None
+        difference = abs(duration - track["duration_ms"] / 1000)
+        if difference > duration_tolerance:
+            return None
+        if duration_tolerance:
+            score += 3 * (1 - difference / duration_tolerance)
+        else:
+            score += 3
+
+    score += 2 * difflib.SequenceMatcher(None, track_name, title).ratio()
+
+    artist_names = [normalize(artist["name"]) for artist in track["artists"]]
+    if any(name and (name in title or name in channel) for name in artist_names):
+        score += 1
+    # Auto-generated "Artist - Topic" channels carry the studio recording
+    if channel.endswith(" topic"):
+        score += 0.5
+
+    isrc = track.get("external_ids", {}).get("isrc")
+    if isrc and isrc.lower() in f"{title} {description}":
+        score += 5
+
+    for marker in VERSION_MARKERS:
+        if re.search(rf"\b{marker}\b", title) and not re.search(
+            rf"\b{marker}\b", track_name
+        ):
+            score -= 2
+    return score
+
+
+def pick_best_candidate(track, entries, duration_tolerance):
+    """
+    Return the search result that best matches a Spotify track.
+
+    Raises:
+        NoMatchError: If no result is acceptable.
+    """
+    scored = [
+        (score, entry)
+        for entry in entries
+        if (score := score_candidate(track, entry, duration_tolerance)) is not None
+    ]
+    if not scored:
+        raise NoMatchError(
+            f"None of {len(entries)} results matches '{track['name']}' within "
+            f"{duration_tolerance}s of its duration"
+        )
+    return max(scored, key=lambda scored_entry: scored_entry[0])[1]
@@ -1,21 +1,216 @@
+import base64
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from mutagen.flac import Picture
+from mutagen.id3 import (
+    ID3,
+    APIC,
+    ID3NoHeaderError,
+    TALB,
+    TDRC,
+    TIT2,
+    TPE1,
+    TPE2,
+    TPOS,
+    TRCK,
+    TSRC,
+    TXXX,
+)
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+from mutagen.oggopus import OggOpus
 import requests
 
-from mutagen.easyid3 import EasyID3
-from mutagen.id3 import ID3, APIC
+from http_session import get_session
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
 
 
 class MetadataManager:
+    def __init__(self, art_cache=None):
+        """
+        Args:
+            art_cache (AlbumArtCache, optional): Cache for album covers. Without
+                it, the cover is downloaded for every track.
+        """
+        self.art_cache = art_cache
+        # Tag writers by file extension, each writes all tags in a single save
+        self.writers = {
+            ".mp3": self._write_id3,
+            ".opus": self._write_vorbis_comments,
+            ".ogg": self._write_vorbis_comments,
+            ".m4a": self._write_mp4,
+        }
+
+    def get_album_art(self, album_art_url):
+        """Return the cover at the URL, or None if it could not be downloaded."""
+        try:
+            if self.art_cache:
+                return self.art_cache.get(album_art_url)
+            with get_metrics().time("art_fetch_seconds"):
+                response = get_session().get(album_art_url, timeout=30)
+            response.raise_for_status()
+            return response.content
+        except (requests.RequestException, OSError) as e:
+            # A missing cover should not fail the track, it is tagged without
+            logger.warning("Could not get the cover %s: %s", album_art_url, e)
+            return None
+
+    def add_metadata(self, file_path, track):
+        """
+        Write all tags of a Spotify track to an audio file in a single save.
+
+        Args:
+            file_path (str): The path to the MP3, Opus or M4A file.
+            track (dict): The Spotify track object.
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in self.writers:
+            raise Exception(f"Cannot tag '{file_path}': unsupported file type")
+        self.writers[extension](file_path, self._get_tags(track))
+
+    def _get_tags(self, track):
+        """Collect the tags of a Spotify track, independent of the container."""
+        album = track["album"]
+        return {
+            "title": track["name"],
+            "artists": [artist["name"] for artist in track["artists"]],
+            "album": album["name"],
+            "album_artist": (
+                album["artists"][0]["name"] if album.get("artists") else None
+            ),
+            "track_number": track.get("track_number"),
+            "total_tracks": album.get("total_tracks"),
+            "disc_number": track.get("disc_number"),
+            "release_date": album.get("release_date"),
+            "isrc": track.get("external_ids", {}).get("isrc"),
+            "spotify_id": track.get("id"),
+            "cover": (
+                self.get_album_art(album["images"][0]["url"])
+                if album.get("images")
+                else None
+            ),
+        }
+
     @staticmethod
-    def add_metadata(file_path, song_name, artist_name, album_name, album_art_url):
-        audio = EasyID3(file_path)
-        audio["title"] = song_name
-        audio["artist"] = artist_name
-        audio["album"] = album_name
+    def _write_id3(file_path, tags):
+        try:
+            audio = ID3(file_path)
+        except ID3NoHeaderError:
+            audio = ID3()
+
+        audio.setall("TIT2", [TIT2(encoding=3, text=tags["title"])])
+        audio.setall("TPE1", [TPE1(encoding=3, text=tags["artists"])])
+        audio.setall("TALB", [TALB(encoding=3, text=tags["album"])])
+        if tags["album_artist"]:
+            audio.setall("TPE2", [TPE2(encoding=3, text=tags["album_artist"])])
+        if tags["track_number"]:
+            track_number = str(tags["track_number"])
+            if tags["total_tracks"]:
+                track_number += f"/{tags['total_tracks']}"
+            audio.setall("TRCK", [TRCK(encoding=3, text=track_number)])
+        if tags["disc_number"]:
+            audio.setall("TPOS", [TPOS(encoding=3, text=str(tags["disc_number"]))])
+        if tags["release_date"]:
+            audio.setall("TDRC", [TDRC(encoding=3, text=tags["release_date"])])
+        if tags["isrc"]:
+            audio.setall("TSRC", [TSRC(encoding=3, text=tags["isrc"])])
+        if tags["spotify_id"]:
+            audio.setall(
+                "TXXX:Spotify ID",
+                [TXXX(encoding=3, desc="Spotify ID", text=tags["spotify_id"])],
+            )
+        if tags["cover"]:
+            audio.setall(
+                "APIC",
+                [
+                    APIC(
+                        encoding=3,
+                        mime="image/jpeg",
+                        type=3,
+                        desc="Cover",
+                        data=tags["cover"],
+                    )
+                ],
+            )
+        audio.save(file_path)
+
+    @staticmethod
+    def _write_vorbis_comments(file_path, tags):
+        audio = OggOpus(file_path)
+        audio["title"] = tags["title"]
+        audio["artist"] = tags["artists"]
+        audio["album"] = tags["album"]
+        if tags["album_artist"]:
+            audio["albumartist"] = tags["album_artist"]
+        if tags["track_number"]:
+            audio["tracknumber"] = str(tags["track_number"])
+        if tags["total_tracks"]:
+            audio["tracktotal"] = str(tags["total_tracks"])
+        if tags["disc_number"]:
+            audio["discnumber"] = str(tags["disc_number"])
+        if tags["release_date"]:
+            audio["date"] = tags["release_date"]
+        if tags["isrc"]:
+            audio["isrc"] = tags["isrc"]
+        if tags["spotify_id"]:
+            audio["spotify_id"] = tags["spotify_id"]
+        if tags["cover"]:
+            # Ogg has no picture frame, the FLAC picture block is stored base64 encoded
+            picture = Picture()
+            picture.type = 3
+            picture.mime = "image/jpeg"
+            picture.desc = "Cover"
+            picture.data = tags["cover"]
+            audio["metadata_block_picture"] = base64.b64encode(picture.write()).decode(
+                "ascii"
+            )
         audio.save()
 
-        album_art = requests.get(album_art_url).content
-        audio = ID3(file_path)
-        audio["APIC"] = APIC(
-            encoding=3, mime="image/jpeg", type=3, desc="Cover", data=album_art
-        )
+    @staticmethod
+    def _write_mp4(file_path, tags):
+        audio = MP4(file_path)
+        audio["\xa9nam"] = tags["title"]
+        audio["\xa9ART"] = tags["artists"]
+        audio["\xa9alb"] = tags["album"]
+        if tags["album_artist"]:
+            audio["aART"] = tags["album_artist"]
+        if tags["track_number"]:
+            audio["trkn"] = [(tags["track_number"], tags["total_tracks"] or 0)]
+        if tags["disc_number"]:
+            audio["disk"] = [(tags["disc_number"], 0)]
+        if tags["release_date"]:
+            audio["\xa9day"] = tags["release_date"]
+        if tags["isrc"]:
+            audio["----:com.apple.iTunes:ISRC"] = MP4FreeForm(tags["isrc"].encode())
+        if tags["spotify_id"]:
+            audio["----:com.apple.iTunes:Spotify ID"] = MP4FreeForm(
+                tags["spotify_id"].encode()
+            )
+        if tags["cover"]:
+            audio["covr"] = [MP4Cover(tags["cover"], imageformat=MP4Cover.FORMAT_JPEG)]
         audio.save()
+
+    def add_metadata_batch(self, files, max_workers=4):
+        """
+        Tag many files on a pool of workers, e.g. to re-tag a whole library.
+
+        Args:
+            files (iterable[tuple[str, dict]]): Pairs of file path and track.
+            max_workers (int, optional): The number of files tagged at once.
+
+        Returns:
+            dict: The exception raised for every file that could not be tagged.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                file_path: executor.submit(self.add_metadata, file_path, track)
+                for file_path, track in files
+            }
+        return {
+            file_path: future.exception()
+            for file_path, future in futures.items()
+            if future.exception()
+        }
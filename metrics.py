@@ -0,0 +1,239 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the histogram buckets, from a cached lookup to a
+# long download
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Observations per bucket, the last one for values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound),
+            len(self.buckets),
+        )
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """The number of observations at or below each bound, then in total."""
+        total = 0
+        counts = []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    """
+    Counters and duration histograms of the downloader, by name and labels.
+
+    Recording is cheap and thread-safe, so it can be done on every call. The
+    values are read through `to_dict` or `render_prometheus`, e.g. by a
+    MetricsServer. Gauges, values that go up and down such as the number of
+    busy workers, are read from collectors when the metrics are rendered.
+    """
+
+    PREFIX = "music_downloader_"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, Histogram] = {}
+        # Functions returning a list of (name, labels, value) gauges
+        self.collectors: list = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the duration of the `with` block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def _collect_gauges(self):
+        gauges = []
+        for collector in list(self.collectors):
+            try:
+                gauges.extend(collector())
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return gauges
+
+    def to_dict(self):
+        """
+        Return every metric as JSON-serializable data.
+
+        Returns:
+            dict: Lists of `counters`, `gauges` and `histograms`, each entry
+                with its `name`, `labels` and `value`, or for histograms the
+                `count`, `sum` and cumulative `buckets` by upper bound.
+        """
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(
+                        zip(
+                            [str(bound) for bound in self.buckets] + ["+Inf"],
+                            histogram.cumulative_counts(),
+                        )
+                    ),
+                }
+                for (name, labels), histogram in self.histograms.items()
+            ]
+        gauges = [
+            {"name": name, "labels": labels, "value": value}
+            for name, labels, value in self._collect_gauges()
+        ]
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def render_prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        data = self.to_dict()
+        lines = []
+        typed = set()
+
+        def add(kind, name, labels, value, suffix=""):
+            name = self.PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {value}")
+
+        for counter in sorted(data["counters"], key=lambda c: c["name"]):
+            add("counter", counter["name"], counter["labels"], counter["value"])
+        for gauge in sorted(data["gauges"], key=lambda g: g["name"]):
+            add("gauge", gauge["name"], gauge["labels"], gauge["value"])
+        for histogram in sorted(data["histograms"], key=lambda h: h["name"]):
+            name, labels = histogram["name"], histogram["labels"]
+            for bound, count in histogram["buckets"].items():
+                add("histogram", name, {**labels, "le": bound}, count, "_bucket")
+            add("histogram", name, labels, histogram["sum"], "_sum")
+            add("histogram", name, labels, histogram["count"], "_count")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+_metrics: Metrics | None = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the Metrics shared by every module of the app."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+class MetricsServer:
+    """
+    Serves metrics over HTTP on the local machine, as Prometheus text at
+    /metrics and as JSON at /metrics.json.
+    """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        """
+        Start serving in a background thread.
+
+        Args:
+            metrics (Metrics): The metrics to serve.
+            port (int): The port to listen on, 0 for any free port.
+            host (str, optional): The address to listen on. Defaults to
+                localhost only.
+        """
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                path = handler.path.split("?")[0]
+                if path == "/metrics":
+                    body = metrics.render_prometheus()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(metrics.to_dict())
+                    content_type = "application/json"
+                else:
+                    handler.send_error(404)
+                    return
+                data = body.encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", content_type)
+                handler.send_header("Content-Length", str(len(data)))
+                handler.end_headers()
+                handler.wfile.write(data)
+
+            def log_message(handler, format, *args):
+                logger.debug(format, *args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        logger.info("Serving metrics on http://%s:%d/metrics", host, self.port)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,266 @@
+import logging
+import queue
+import threading
+import time
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Returned by a stage handler that takes the job out of the pipeline, e.g. to
+# let another job finish it. Whoever holds it then calls Pipeline.complete.
+DETACHED = "detached"
+
+
+class Job:
+    """
+    A unit of work moving through the stages of a Pipeline.
+
+    Subclasses add the data the stage handlers read and fill in.
+    """
+
+    def __init__(self, update_progress=None, on_done=None):
+        """
+        Args:
+            update_progress (function, optional): Called with the number of
+                completed stages and the total number of stages.
+            on_done (function, optional): Called with the job once it has left
+                the pipeline, successfully or not.
+        """
+        self.update_progress = update_progress
+        self.on_done = on_done
+        self.stage: str | None = None
+        self.error: Exception | None = None
+        # A cProfile.Profile to run the job's stage handlers under, if set
+        self.profiler = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def enter_stage(self, stage):
+        """Called by the pipeline when a stage starts handling the job."""
+        self.stage = stage
+
+    def wait(self, timeout=None):
+        """Block until the job has left the pipeline."""
+        return self._done.wait(timeout)
+
+
+class ConcurrencyLimiter:
+    """Semaphore whose limit can be changed while threads are waiting on it."""
+
+    def __init__(self, limit):
+        self._condition = threading.Condition()
+        self._limit = limit
+        self._active = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def active(self):
+        return self._active
+
+    def set_limit(self, limit):
+        with self._condition:
+            self._limit = max(1, limit)
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+class Stage:
+    def __init__(self, name, handler, workers, controller=None):
+        """
+        Args:
+            name (str): The name of the stage.
+            handler (function): Called with each job; raising fails the job.
+            workers (int): The number of jobs handled at once.
+            controller (AIMDController, optional): Told the duration and error of
+                every job, to adapt the number of workers.
+        """
+        self.name = name
+        self.handler = handler
+        self.limiter = ConcurrencyLimiter(workers)
+        self.controller = controller
+        self.threads: list[threading.Thread] = []
+
+    @property
+    def workers(self):
+        return self.limiter.limit
+
+
+class Pipeline:
+    """
+    Runs jobs through a sequence of stages, each with its own worker threads.
+
+    Stages are connected by bounded queues. When a stage falls behind, the
+    queue in front of it fills up and the stages before it block, down to
+    `submit`, so no stage runs arbitrarily far ahead of the others. The number
+    of workers of a stage can be changed while jobs are running.
+
+    The duration and outcome of every stage are recorded in the shared Metrics
+    as `stage_seconds` and `stage_jobs_total`.
+    """
+
+    def __init__(self, stages, queue_size=50):
+        """
+        Start the worker threads of every stage.
+
+        Args:
+            stages (list[Stage]): The stages, in the order jobs go through them.
+            queue_size (int, optional): The number of jobs waiting in front of
+                each stage before the previous stage blocks.
+        """
+        self.stages = stages
+        self.metrics = get_metrics()
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._threads_lock = threading.Lock()
+        for index, stage in enumerate(stages):
+            self._start_workers(index, stage.workers)
+
+    def _start_workers(self, index, workers):
+        stage = self.stages[index]
+        with self._threads_lock:
+            while len(stage.threads) < workers:
+                thread = threading.Thread(
+                    target=self._run_stage,
+                    args=(index,),
+                    name=f"{stage.name}-worker",
+                    daemon=True,
+                )
+                thread.start()
+                stage.threads.append(thread)
+
+    def _stage_index(self, stage):
+        if isinstance(stage, int):
+            return stage
+        return next(i for i, s in enumerate(self.stages) if s.name == stage)
+
+    def get_stage(self, stage):
+        """Return a stage by index or name."""
+        return self.stages[self._stage_index(stage)]
+
+    def set_workers(self, stage, workers):
+        """
+        Change the number of jobs a stage handles at once.
+
+        Threads are started as needed; when the number is lowered, the extra
+        threads finish their current job and then wait idle.
+
+        Args:
+            stage (int | str): The index or name of the stage.
+            workers (int): The new number of workers.
+        """
+        index = self._stage_index(stage)
+        self.stages[index].limiter.set_limit(workers)
+        self._start_workers(index, workers)
+
+    def collect_metrics(self):
+        """Metrics collector: the workers, busy workers and queued jobs per stage."""
+        gauges = []
+        for stage, stage_queue in zip(self.stages, self.queues):
+            labels = {"stage": stage.name}
+            gauges.append(("stage_workers", labels, stage.workers))
+            gauges.append(("stage_active_jobs", labels, stage.limiter.active))
+            gauges.append(("stage_queued_jobs", labels, stage_queue.qsize()))
+        return gauges
+
+    def submit(self, job, stage=0):
+        """
+        Queue a job, blocking while the stage's queue is full.
+
+        Args:
+            job (Job): The job to run.
+            stage (int | str, optional): The index or name of the first stage to
+                run, for jobs whose earlier stages are already done.
+        """
+        self.queues[self._stage_index(stage)].put(job)
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        while True:
+            job = self.queues[index].get()
+            if job is None:
+                break
+            # The limit may have been lowered while this thread was waiting
+            stage.limiter.acquire()
+            try:
+                self._run_job(index, job)
+            finally:
+                stage.limiter.release()
+
+    def _run_job(self, index, job):
+        stage = self.stages[index]
+        total_stages = len(self.stages)
+        job.enter_stage(stage.name)
+        if job.update_progress:
+            job.update_progress(index, total_stages)
+
+        start = time.monotonic()
+        try:
+            if job.profiler:
+                result = job.profiler.runcall(stage.handler, job)
+            else:
+                result = stage.handler(job)
+        except Exception as e:
+            job.error = e
+            result = None
+        duration = time.monotonic() - start
+        if stage.controller:
+            stage.controller.record(duration, job.error)
+        self.metrics.observe("stage_seconds", duration, stage=stage.name)
+        # A detached job may already be finished by another thread, which can
+        # set its error, so it is not looked at again
+        if result == DETACHED:
+            self.metrics.increment(
+                "stage_jobs_total", stage=stage.name, outcome=DETACHED
+            )
+            return
+        self.metrics.increment(
+            "stage_jobs_total",
+            stage=stage.name,
+            outcome="failed" if job.error else "completed",
+        )
+
+        if job.error is not None:
+            self._finish(job)
+        elif index + 1 < total_stages:
+            self.queues[index + 1].put(job)
+        else:
+            self._finish(job)
+
+    def complete(self, job):
+        """Finish a job a stage handler detached, successfully unless it has an error."""
+        self._finish(job)
+
+    def _finish(self, job):
+        if job.update_progress and job.error is None:
+            job.update_progress(len(self.stages), len(self.stages))
+        job._done.set()
+        if job.on_done:
+            try:
+                job.on_done(job)
+            except Exception:
+                # A failing callback must not take the worker thread down with it
+                logger.exception("Error in job completion callback")
+
+    def shutdown(self):
+        """Let the queued jobs finish, then stop the worker threads stage by stage."""
+        for index, stage in enumerate(self.stages):
+            for _ in stage.threads:
+                self.queues[index].put(None)
+            for thread in stage.threads:
+                thread.join()
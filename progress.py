@@ -0,0 +1,289 @@
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def format_bytes(size):
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+
+class TrackProgress:
+    """
+    Progress of one track: the pipeline stage it is in and, while its audio
+    is downloading, the bytes, speed and ETA reported by yt-dlp.
+
+    Only its ProgressTracker changes it; readers may see a value being
+    updated, which is fine for display.
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.status = QUEUED
+        self.stage: str | None = None
+        # What yt-dlp is doing after the download, e.g. "FixupM4a"
+        self.postprocessor: str | None = None
+        self.downloaded_bytes = 0
+        self.total_bytes: int | None = None
+        self.speed: float | None = None
+        self.eta: float | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+        self._notified_at = 0.0
+
+    @property
+    def fraction(self):
+        """The downloaded fraction of the audio, or None if the size is unknown."""
+        if not self.total_bytes:
+            return None
+        return min(self.downloaded_bytes / self.total_bytes, 1.0)
+
+    def describe(self):
+        """A short human-readable status, e.g. "fetch 45%, 1.2 MB/s, ETA 3s"."""
+        if self.status == DONE:
+            return "Completed"
+        if self.status == FAILED:
+            return f"Failed: {self.error}"
+        if self.stage is None:
+            return "Queued"
+        parts = [self.postprocessor or self.stage]
+        if self.stage == "fetch" and self.downloaded_bytes:
+            fraction = self.fraction
+            if fraction is not None:
+                parts[0] += f" {fraction:.0%}"
+            else:
+                parts[0] += f" {format_bytes(self.downloaded_bytes)}"
+            if self.speed:
+                parts.append(f"{format_bytes(self.speed)}/s")
+            if self.eta is not None:
+                parts.append(f"ETA {format_duration(self.eta)}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "status": self.status,
+            "stage": self.stage,
+            "postprocessor": self.postprocessor,
+            "downloaded_bytes": self.downloaded_bytes,
+            "total_bytes": self.total_bytes,
+            "speed": self.speed,
+            "eta": self.eta,
+            "error": self.error,
+        }
+
+
+class ProgressTracker:
+    """
+    Progress of a batch of tracks, e.g. a playlist, aggregated into the total
+    throughput and an estimated completion time.
+
+    The downloader feeds it from the pipeline stages and from yt-dlp's
+    progress and postprocessor hooks; the GUI, the CLI and the metrics read
+    it. Listeners are called with the tracker and the changed track. Byte
+    updates are passed on at most every NOTIFY_INTERVAL seconds per track,
+    stage changes and completions always.
+
+    The totals are kept up to date as tracks change, so a snapshot only
+    visits the running tracks, however large the batch.
+    """
+
+    NOTIFY_INTERVAL = 0.5
+
+    def __init__(self, title, listeners=None):
+        """
+        Args:
+            title (str): The name of the batch.
+            listeners (list[function], optional): Called with the tracker and
+                the changed TrackProgress. The list is shared, so listeners
+                added later are called too.
+        """
+        self.title = title
+        self.listeners = listeners if listeners is not None else []
+        self.tracks: list[TrackProgress] = []
+        self.started_at = time.monotonic()
+        # Whether every track of the batch has been added
+        self.listed = False
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._stages: dict[str, int] = {}
+        self._running: set[TrackProgress] = set()
+        self._downloaded_bytes = 0
+        self._finished_at: float | None = None
+
+    def add_track(self, title):
+        track = TrackProgress(title)
+        with self._lock:
+            self.tracks.append(track)
+        self._notify(track)
+        return track
+
+    def _uncount(self, track):
+        # Remove the track from the totals of its current status
+        if track.status == DONE:
+            self._completed -= 1
+        elif track.status == FAILED:
+            self._failed -= 1
+        elif track.status == RUNNING:
+            self._running.discard(track)
+            self._stages[track.stage] -= 1
+            if not self._stages[track.stage]:
+                del self._stages[track.stage]
+
+    def set_stage(self, track, stage):
+        with self._lock:
+            self._uncount(track)
+            if track.started_at is None:
+                track.started_at = time.monotonic()
+            track.status = RUNNING
+            track.stage = stage
+            track.postprocessor = None
+            track.speed = track.eta = None
+            self._running.add(track)
+            self._stages[stage] = self._stages.get(stage, 0) + 1
+        self._notify(track)
+
+    def update_download(self, track, downloaded_bytes, total_bytes, speed, eta):
+        """Record a yt-dlp progress report of the track's audio download."""
+        with self._lock:
+            self._downloaded_bytes += downloaded_bytes - track.downloaded_bytes
+            track.downloaded_bytes = downloaded_bytes
+            track.total_bytes = total_bytes
+            track.speed = speed
+            track.eta = eta
+        self._notify(track, force=downloaded_bytes == total_bytes)
+
+    def set_postprocessor(self, track, postprocessor):
+        with self._lock:
+            track.postprocessor = postprocessor
+        self._notify(track)
+
+    def finish(self, track, error=None):
+        with self._lock:
+            self._uncount(track)
+            track.status = FAILED if error else DONE
+            track.error = str(error) if error else None
+            track.finished_at = time.monotonic()
+            track.speed = track.eta = None
+            if error:
+                self._failed += 1
+            else:
+                self._completed += 1
+            self._finished_at = track.finished_at
+        self._notify(track)
+
+    def close(self):
+        """Mark that every track has been added, so the total is final."""
+        self.listed = True
+
+    def _notify(self, track, force=True):
+        now = time.monotonic()
+        if not force and now - track._notified_at < self.NOTIFY_INTERVAL:
+            return
+        track._notified_at = now
+        for listener in self.listeners:
+            listener(self, track)
+
+    def snapshot(self):
+        """
+        Aggregate the batch.
+
+        Returns:
+            dict: The `title`, whether all tracks are `listed`, the number of
+                `tracks`, `completed` and `failed` tracks, the running tracks
+                per pipeline stage (`stages`), the `downloaded_bytes`, the
+                current `speed` in bytes per second, the `elapsed` seconds and
+                the `eta` in seconds (None until a track has finished).
+        """
+        with self._lock:
+            total = len(self.tracks)
+            completed = self._completed
+            failed = self._failed
+            stages = dict(self._stages)
+            downloaded = self._downloaded_bytes
+            speed = float(sum(track.speed or 0 for track in self._running))
+            finished_at = self._finished_at
+        finished = completed + failed
+        remaining = total - finished
+        end = time.monotonic()
+        if self.listed and total and not remaining:
+            end = finished_at
+        elapsed = end - self.started_at
+        eta = None
+        if finished and remaining:
+            # Tracks overlap in the pipeline, so the rate of the whole batch
+            # is a better estimate than the time of a single track
+            eta = remaining * elapsed / finished
+        elif self.listed and not remaining:
+            eta = 0.0
+        return {
+            "title": self.title,
+            "listed": self.listed,
+            "tracks": total,
+            "completed": completed,
+            "failed": failed,
+            "stages": stages,
+            "downloaded_bytes": downloaded,
+            "speed": speed,
+            "elapsed": elapsed,
+            "eta": eta,
+        }
+
+    def describe(self):
+        return describe_snapshot(self.snapshot())
+
+
+def combine_snapshots(snapshots):
+    """Aggregate the snapshots of several batches into one, e.g. for a summary."""
+    combined = {
+        "title": ", ".join(snapshot["title"] for snapshot in snapshots),
+        "listed": all(snapshot["listed"] for snapshot in snapshots),
+        "tracks": 0,
+        "completed": 0,
+        "failed": 0,
+        "stages": {},
+        "downloaded_bytes": 0,
+        "speed": 0.0,
+        "elapsed": max((snapshot["elapsed"] for snapshot in snapshots), default=0.0),
+        "eta": None,
+    }
+    for snapshot in snapshots:
+        for key in ("tracks", "completed", "failed", "downloaded_bytes", "speed"):
+            combined[key] += snapshot[key]
+        for stage, count in snapshot["stages"].items():
+            combined["stages"][stage] = combined["stages"].get(stage, 0) + count
+        # The batches run side by side, the last one to finish decides
+        if snapshot["eta"] is not None:
+            combined["eta"] = max(combined["eta"] or 0.0, snapshot["eta"])
+    return combined
+
+
+def describe_snapshot(snapshot):
+    """A short human-readable summary, e.g. "12/300, 4.1 MB/s, ETA 6m 10s"."""
+    parts = [f"{snapshot['completed']}/{snapshot['tracks']}"]
+    if snapshot["failed"]:
+        parts.append(f"{snapshot['failed']} failed")
+    if snapshot["speed"]:
+        parts.append(f"{format_bytes(snapshot['speed'])}/s")
+    if snapshot["eta"]:
+        parts.append(f"ETA {format_duration(snapshot['eta'])}")
+    return ", ".join(parts)
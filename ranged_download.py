@@ -0,0 +1,185 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Ranges smaller than this are not worth a connection of their own
+MIN_RANGE_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class RangedDownload:
+    """
+    Downloads one file over several connections, each fetching its own byte
+    range, so a server limiting the speed of a single connection does not
+    limit the download.
+
+    yt-dlp only downloads fragmented streams in parallel; YouTube's usual
+    audio formats are a single file, which it fetches one range after the
+    other. Every range is written to its own part file named after its bytes,
+    so an interrupted download resumes each range where it stopped. The parts
+    are joined once all of them are complete.
+    """
+
+    def __init__(
+        self,
+        urlopen,
+        url,
+        file_path,
+        connections,
+        total_bytes=None,
+        on_data=None,
+        progress_hook=None,
+    ):
+        """
+        Args:
+            urlopen (function): Called with the URL and the request headers,
+                returns a response with `status`, `headers`, `read` and `close`.
+            url (str): The URL of the file.
+            file_path (str): The path to download the file to.
+            connections (int): The largest number of ranges fetched at once.
+            total_bytes (int, optional): The size of the file, if known.
+                Otherwise the server is asked for it.
+            on_data (function, optional): Called with the size of every chunk
+                received, from the connection's thread, e.g. to throttle it.
+            progress_hook (function, optional): Called with a status dict like
+                yt-dlp's progress hooks get: the `status`, `filename`,
+                `downloaded_bytes`, `total_bytes`, `speed` and `eta`.
+        """
+        self.urlopen = urlopen
+        self.url = url
+        self.file_path = file_path
+        self.connections = connections
+        self.total_bytes = total_bytes
+        self.on_data = on_data
+        self.progress_hook = progress_hook
+        self.downloaded_bytes = 0
+        self._resumed_bytes = 0
+        self._started_at = 0.0
+        self._lock = threading.Lock()
+
+    def plan(self):
+        """
+        Split the file into ranges, asking the server for its size if needed.
+
+        Returns:
+            list[tuple[int, int]] | None: The first and last byte of every
+                range, or None if the file is too small to split or the
+                server does not answer range requests.
+        """
+        if not self.total_bytes:
+            response = self.urlopen(self.url, {"Range": "bytes=0-0"})
+            try:
+                match = CONTENT_RANGE.fullmatch(
+                    response.headers.get("Content-Range", "")
+                )
+                if response.status != 206 or not match:
+                    return None
+                self.total_bytes = int(match.group(3))
+            finally:
+                response.close()
+        count = min(self.connections, self.total_bytes // MIN_RANGE_SIZE)
+        if count < 2:
+            return None
+        size = -(-self.total_bytes // count)
+        return [
+            (start, min(start + size, self.total_bytes) - 1)
+            for start in range(0, self.total_bytes, size)
+        ]
+
+    def _part_path(self, start, end):
+        return f"{self.file_path}.part-{start}-{end}"
+
+    def run(self, ranges):
+        """
+        Download the ranges returned by `plan` and join them into the file.
+
+        Parts of an earlier attempt that match the ranges are resumed, other
+        parts of the file are deleted.
+        """
+        part_paths = [self._part_path(start, end) for start, end in ranges]
+        directory, name = os.path.split(self.file_path)
+        for file in os.scandir(directory or "."):
+            if file.name.startswith(f"{name}.part-") and file.path not in part_paths:
+                os.remove(file.path)
+        for path in part_paths:
+            if os.path.exists(path):
+                self._resumed_bytes += os.path.getsize(path)
+        self.downloaded_bytes = self._resumed_bytes
+        self._started_at = time.monotonic()
+
+        with ThreadPoolExecutor(
+            max_workers=len(ranges), thread_name_prefix="range"
+        ) as executor:
+            futures = [
+                executor.submit(self._fetch_range, start, end) for start, end in ranges
+            ]
+            # Raise the first error, once every range has stopped
+            for future in futures:
+                future.result()
+
+        temp_path = self.file_path + ".part"
+        with open(temp_path, "wb") as f:
+            for path in part_paths:
+                with open(path, "rb") as part:
+                    while chunk := part.read(READ_SIZE):
+                        f.write(chunk)
+        os.replace(temp_path, self.file_path)
+        for path in part_paths:
+            os.remove(path)
+        self._report("finished")
+
+    def _fetch_range(self, start, end):
+        path = self._part_path(start, end)
+        done = os.path.getsize(path) if os.path.exists(path) else 0
+        if start + done > end:
+            return
+        response = self.urlopen(self.url, {"Range": f"bytes={start + done}-{end}"})
+        try:
+            match = CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", ""))
+            if (
+                response.status != 206
+                or not match
+                or int(match.group(1)) != start + done
+            ):
+                raise OSError(f"The server ignored the range {start + done}-{end}")
+            with open(path, "ab") as f:
+                while chunk := response.read(min(READ_SIZE, end + 1 - start - done)):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if self.on_data:
+                        self.on_data(len(chunk))
+                    with self._lock:
+                        self.downloaded_bytes += len(chunk)
+                        self._report("downloading")
+                    if start + done > end:
+                        break
+        finally:
+            response.close()
+        if start + done <= end:
+            # Worded like the network errors the retry policy retries
+            raise OSError(f"Remote end closed connection at byte {start + done}")
+
+    def _report(self, status):
+        if not self.progress_hook:
+            return
+        elapsed = time.monotonic() - self._started_at
+        speed = (
+            (self.downloaded_bytes - self._resumed_bytes) / elapsed if elapsed else None
+        )
+        eta = None
+        if speed:
+            eta = (self.total_bytes - self.downloaded_bytes) / speed
+        self.progress_hook(
+            {
+                "status": status,
+                "filename": self.file_path,
+                "tmpfilename": self.file_path + ".part",
+                "downloaded_bytes": self.downloaded_bytes,
+                "total_bytes": self.total_bytes,
+                "speed": speed,
+                "eta": eta,
+            }
+        )
@@ -0,0 +1,244 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from bandwidth import TokenBucket
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+TRANSIENT_MARKERS = (
+    "timed out",
+    "timeout",
+    "connection reset",
+    "connection aborted",
+    "temporary failure",
+    "remote end closed",
+    "http error 500",
+    "http error 502",
+    "http error 503",
+    "http error 504",
+)
+# Matched against the whole message, so a status is only recognized in the
+# "HTTP Error <status>" wording of yt-dlp and urllib, not in any video ID,
+# URL or byte count containing its digits
+THROTTLING_MARKERS = (
+    "http error 429",
+    "too many requests",
+    "rate limit",
+    "confirm you're not a bot",
+    "confirm you’re not a bot",
+)
+
+
+def is_throttling_error(error):
+    """Check whether an error means the remote service is rate limiting us."""
+    return classify_error(error) == THROTTLED
+
+
+def get_http_status(error):
+    """
+    Return the HTTP status of an error, if it carries one: Spotify's
+    `http_status`, yt-dlp's and urllib's `status` or `code`, or the status of
+    a requests response. yt-dlp wraps the original error in a DownloadError,
+    which is looked into too.
+    """
+    for candidate in (error, (getattr(error, "exc_info", None) or (None, None))[1]):
+        if candidate is None:
+            continue
+        for attribute in ("http_status", "status", "code"):
+            status = getattr(candidate, attribute, None)
+            if isinstance(status, int):
+                return status
+        response = getattr(candidate, "response", None)
+        if isinstance(getattr(response, "status_code", None), int):
+            return response.status_code
+    return None
+
+
+def classify_error(error):
+    """
+    Classify an error from Spotify or yt-dlp by whether retrying can help.
+
+    Returns:
+        str: THROTTLED when the service asks us to slow down, TRANSIENT for
+            network and server errors, PERMANENT for everything else.
+    """
+    status = get_http_status(error)
+    if status == 429:
+        return THROTTLED
+    if status is not None and status >= 500:
+        return TRANSIENT
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return TRANSIENT
+
+    message = str(error).lower()
+    if any(marker in message for marker in THROTTLING_MARKERS):
+        return THROTTLED
+    if status is None and any(marker in message for marker in TRANSIENT_MARKERS):
+        return TRANSIENT
+    return PERMANENT
+
+
+def get_retry_after(error):
+    """Return the seconds a throttled service asked us to wait, if it said so."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Exponential backoff with full jitter, so workers do not retry in lockstep."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of a source and trips after too many.
+
+    A tripped breaker pauses the source; the first call after the pause is a
+    trial, which closes the breaker on success and trips it again on failure.
+    """
+
+    def __init__(self, failure_threshold=5, pause_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.pause_seconds = pause_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        """
+        Returns:
+            float | None: How long to pause the source if the breaker tripped.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return None
+            # Leave a single trial call after the pause
+            self._failures = self.failure_threshold - 1
+            return self.pause_seconds
+
+
+class Source:
+    """
+    A remote service shared by all worker threads, e.g. Spotify or YouTube.
+
+    Calls through the source are rate limited, retried with jittered
+    exponential backoff when the error is temporary, and held back while the
+    source is paused: after a `Retry-After`, on throttling, or when its
+    circuit breaker trips. A pause applies to every thread, not only to the
+    one that was throttled.
+    """
+
+    def __init__(
+        self,
+        name,
+        requests_per_second=0,
+        max_retries=4,
+        failure_threshold=5,
+        pause_seconds=60,
+        on_throttled=None,
+    ):
+        """
+        Args:
+            name (str): The name of the source, for messages.
+            requests_per_second (float, optional): The highest call rate, zero
+                for unlimited.
+            max_retries (int, optional): The retries of a call with a temporary
+                error.
+            failure_threshold (int, optional): The consecutive failures that
+                trip the circuit breaker.
+            pause_seconds (float, optional): How long a tripped breaker pauses
+                the source.
+            on_throttled (function, optional): Called whenever the source
+                throttles a call, e.g. to lower the concurrency.
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.on_throttled = on_throttled
+        self.breaker = CircuitBreaker(failure_threshold, pause_seconds)
+        self._bucket = TokenBucket(requests_per_second)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.metrics = get_metrics()
+
+    def pause(self, seconds):
+        """Hold back all calls to the source for at least `seconds`."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait(self):
+        while True:
+            with self._lock:
+                delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        self._bucket.consume(1)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call `function` under the source's rate limit and retry policy.
+
+        Returns:
+            The result of `function`.
+
+        Raises:
+            Exception: The last error, when it is permanent or retries ran out.
+        """
+        attempt = 0
+        while True:
+            self._wait()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                self.metrics.increment(
+                    "source_errors_total", source=self.name, kind=kind
+                )
+                if kind == PERMANENT:
+                    raise
+
+                delay = backoff_delay(attempt)
+                if kind == THROTTLED:
+                    delay = get_retry_after(e) or delay
+                    self.pause(delay)
+                    if self.on_throttled:
+                        self.on_throttled()
+                pause = self.breaker.record_failure()
+                if pause:
+                    self.metrics.increment(
+                        "circuit_breaker_trips_total", source=self.name
+                    )
+                    logger.warning(
+                        "[%s] Too many failures, pausing %ss", self.name, pause
+                    )
+                    self.pause(pause)
+
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.metrics.increment("source_retries_total", source=self.name)
+                logger.warning(
+                    "[%s] %s error, retrying: %s", self.name, kind.capitalize(), e
+                )
+                if kind != THROTTLED:
+                    time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
@@ -1,23 +1,189 @@
+from collections import OrderedDict
+import threading
+
+import requests
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from cache import SpotifyTokenCache
+from metrics import get_metrics
+from retry import Source
+
 
 class SpotifyClient:
-    def __init__(self, client_id=None, client_secret=None):
+    # Maximum number of IDs accepted by the "Get Several Tracks" endpoint
+    TRACKS_BATCH_SIZE = 50
+    # Number of search results kept in memory, by query
+    SEARCH_CACHE_SIZE = 128
+
+    def __init__(self, client_id=None, client_secret=None, cache=None, source=None):
+        """
+        Args:
+            client_id (str, optional): The Spotify client ID.
+            client_secret (str, optional): The Spotify client secret.
+            cache (MetadataCache, optional): Cache for API responses and the
+                access token. Without it every call goes to Spotify.
+            source (Source, optional): Rate limit and retry policy shared by
+                all threads using the client.
+        """
+        self.cache = cache
+        self.source = source or Source("spotify")
+        self._search_cache: OrderedDict = OrderedDict()
+        self._search_cache_lock = threading.Lock()
         credentials_manager = SpotifyClientCredentials(
-            client_id=client_id, client_secret=client_secret
+            client_id=client_id,
+            client_secret=client_secret,
+            cache_handler=SpotifyTokenCache(cache, client_id) if cache else None,
         )
-        self.client = Spotify(client_credentials_manager=credentials_manager)
+        # A plain session has no urllib3 retry adapter, so a 429 reaches the
+        # shared source with its Retry-After header instead of being slept
+        # off separately in every thread
+        self.client = Spotify(
+            client_credentials_manager=credentials_manager,
+            requests_session=requests.Session(),
+        )
+
+    def _call(self, method, *args, **kwargs):
+        # Timed with the retries and rate limit waits, as the pipeline sees it
+        with get_metrics().time("spotify_request_seconds", method=method):
+            return self.source.call(getattr(self.client, method), *args, **kwargs)
+
+    @staticmethod
+    def extract_id(url):
+        return url.split("/")[-1].split("?")[0]
+
+    def _cached(self, kind, key, fetch):
+        if self.cache is None:
+            return fetch()
+        value = self.cache.get(kind, key)
+        if value is None:
+            value = fetch()
+            self.cache.put(kind, key, value)
+        return value
 
     def get_track_info(self, track_url):
-        track_id = track_url.split("/")[-1].split("?")[0]
-        return self.client.track(track_id)
+        track_id = self.extract_id(track_url)
+        return self._cached("track", track_id, lambda: self._call("track", track_id))
+
+    def get_album_info(self, album_url):
+        album_id = self.extract_id(album_url)
+        return self._cached("album", album_id, lambda: self._call("album", album_id))
+
+    def iter_tracks_info(self, track_urls):
+        """
+        Resolve many track URLs, fetching up to 50 tracks per request.
+
+        Tracks are yielded in the order of `track_urls`; unknown IDs are skipped.
+        """
+        track_ids = [self.extract_id(url) for url in track_urls]
+        for start in range(0, len(track_ids), self.TRACKS_BATCH_SIZE):
+            batch = track_ids[start : start + self.TRACKS_BATCH_SIZE]
+            found = self.cache.get_many("track", batch) if self.cache else {}
+            missing = [track_id for track_id in batch if track_id not in found]
+            if missing:
+                fetched = {
+                    track["id"]: track
+                    for track in self._call("tracks", missing)["tracks"]
+                    if track
+                }
+                if self.cache:
+                    self.cache.put_many("track", fetched)
+                found.update(fetched)
+            for track_id in batch:
+                if track_id in found:
+                    yield found[track_id]
+
+    def get_tracks_info(self, track_urls):
+        return list(self.iter_tracks_info(track_urls))
+
+    def get_playlist_snapshot_id(self, playlist_url):
+        """Return the playlist's current snapshot ID, which changes on every edit."""
+        playlist_id = self.extract_id(playlist_url)
+        return self._call("playlist", playlist_id, fields="snapshot_id")["snapshot_id"]
 
-    def get_playlist_tracks(self, playlist_url):
-        playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        playlist = self.client.playlist(playlist_id)
-        return playlist["tracks"]["items"]
+    def get_playlist_name(self, playlist_url):
+        playlist_id = self.extract_id(playlist_url)
+        return self._cached(
+            "playlist_name",
+            playlist_id,
+            lambda: self._call("playlist", playlist_id, fields="name")["name"],
+        )
+
+    def iter_playlist_tracks(self, playlist_url, snapshot_id=None):
+        """
+        Yield the items of a playlist page by page, following every `next` link.
+
+        Items are yielded as soon as their page arrives, so callers can start
+        working on the first tracks while later pages are still being fetched.
+        When the cached listing matches the playlist's snapshot ID, it is
+        replayed without fetching any page, however old it is.
+
+        Args:
+            playlist_url (str): The Spotify URL of the playlist.
+            snapshot_id (str, optional): The playlist's current snapshot ID,
+                if the caller already has it. Requested otherwise.
+        """
+        playlist_id = self.extract_id(playlist_url)
+        if self.cache is None:
+            yield from self._iter_playlist_pages(playlist_id)
+            return
+
+        if snapshot_id is None:
+            snapshot_id = self.get_playlist_snapshot_id(playlist_url)
+        cached = self.cache.get("playlist", playlist_id)
+        if cached is not None and cached["snapshot_id"] == snapshot_id:
+            yield from cached["items"]
+            return
+
+        items = []
+        for item in self._iter_playlist_pages(playlist_id):
+            items.append(item)
+            yield item
+
+        # Only a complete listing is cached. The snapshot ID tells whether it
+        # is current, not its age.
+        self.cache.put(
+            "playlist",
+            playlist_id,
+            {"snapshot_id": snapshot_id, "items": items},
+            expires=False,
+        )
+        self.cache.put_many(
+            "track",
+            {
+                item["track"]["id"]: item["track"]
+                for item in items
+                if item["track"].get("id")
+            },
+        )
+
+    def _iter_playlist_pages(self, playlist_id):
+        page = self._call("playlist_items", playlist_id, additional_types=("track",))
+        while page:
+            for item in page["items"]:
+                # Local files and removed tracks come back without a track object
+                if item.get("track"):
+                    yield item
+            page = self._call("next", page) if page.get("next") else None
+
+    def get_playlist_tracks(self, playlist_url, snapshot_id=None):
+        return list(self.iter_playlist_tracks(playlist_url, snapshot_id))
 
     def search_tracks(self, query, limit=10):
-        results = self.client.search(q=query, type="track", limit=limit)
-        return results["tracks"]["items"]
+        """
+        Search for tracks, answering repeated queries from an in-memory LRU
+        cache. Queries differing only in case and spacing share an entry.
+        """
+        key = (" ".join(query.lower().split()), limit)
+        with self._search_cache_lock:
+            if key in self._search_cache:
+                self._search_cache.move_to_end(key)
+                return self._search_cache[key]
+
+        results = self._call("search", q=query, type="track", limit=limit)
+        items = results["tracks"]["items"]
+        with self._search_cache_lock:
+            self._search_cache[key] = items
+            while len(self._search_cache) > self.SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return items